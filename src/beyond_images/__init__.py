@@ -8,7 +8,7 @@ Pipeline stages (mirroring the paper):
   3. fusion      - LLM-based Semantic Fusion Module: summarise all captions of an
                    entity into a single coherent paragraph (Flan-T5 / Mistral / Llama).
   4. embedding   - Export enriched text for downstream MMKG models:
-                   sentence embeddings (.h5 for MMRNS, .pth for AdaMF) and
+                   sentence embeddings (.h5 for MMRNS, .pth for AdaMF, memory-mapped .npy) and
                    BERT token ids (.json for MyGO).
 """
 
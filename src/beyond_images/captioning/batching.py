@@ -0,0 +1,107 @@
+"""Adaptive batch sizing for captioners.
+
+A fixed `captioning.batch_size` either OOMs large backends (LLaVA) or leaves
+small ones (BLIP) underusing the device. `AdaptiveBatcher` wraps
+`Captioner.caption_batch` and tunes the batch size while captioning:
+
+  - GPU ("memory"): double after each full batch until an out-of-memory
+    error, then halve and retry the *same* images, so nothing is lost.
+  - CPU ("throughput"): double while images/sec keeps improving, then settle
+    on the fastest size seen.
+
+The settled size is persisted per (backend, model, quantization, device) in
+a small JSON file so later runs start at the right size.
+"""
+
+from __future__ import annotations
+
+import time
+from pathlib import Path
+from typing import Callable
+
+import torch
+from PIL import Image
+
+from ..utils.jsonl import load_json, save_json_atomic
+
+THROUGHPUT_GAIN = 1.05  # growth must beat the best rate by 5% to count
+
+
+def is_oom_error(exc: BaseException) -> bool:
+    if isinstance(exc, (torch.cuda.OutOfMemoryError, MemoryError)):
+        return True
+    message = str(exc).lower()
+    return isinstance(exc, RuntimeError) and ("out of memory" in message or "can't allocate" in message)
+
+
+class AdaptiveBatcher:
+    """Caption arbitrarily long image lists in self-tuning sub-batches."""
+
+    def __init__(
+        self,
+        caption_fn: Callable[[list[Image.Image]], list[str]],
+        key: str,
+        start_size: int = 8,
+        max_size: int = 64,
+        state_path: str | Path | None = None,
+        mode: str = "memory",
+    ):
+        self.caption_fn = caption_fn
+        self.key = key
+        self.max_size = max_size
+        self.state_path = Path(state_path) if state_path else None
+        self.mode = mode
+        state = load_json(self.state_path) if self.state_path and self.state_path.exists() else {}
+        self.size = min(int(state.get(key, start_size)), max_size)
+        self.settled = key in state
+        self._best_rate = 0.0
+        self._best_size = self.size
+
+    def __call__(self, images: list[Image.Image]) -> list[str]:
+        captions: list[str] = []
+        start = 0
+        while start < len(images):
+            chunk = images[start : start + self.size]
+            started = time.perf_counter()
+            try:
+                captions.extend(self.caption_fn(chunk))
+            except Exception as exc:
+                if not is_oom_error(exc) or self.size == 1:
+                    raise
+                self._back_off()
+                continue  # retry the same images at the smaller size
+            if len(chunk) == self.size:
+                self._observe(len(chunk) / max(time.perf_counter() - started, 1e-6))
+            start += len(chunk)
+        return captions
+
+    def _back_off(self) -> None:
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+        self.size = max(1, self.size // 2)
+        self.max_size = self.size
+        print(f"[caption] out of memory; batch size -> {self.size}")
+        self._settle()
+
+    def _observe(self, rate: float) -> None:
+        if self.settled:
+            return
+        if self.mode == "throughput":
+            if rate < self._best_rate * THROUGHPUT_GAIN:
+                self.size = self._best_size
+                self._settle()
+                return
+            self._best_rate, self._best_size = rate, self.size
+        if self.size >= self.max_size:
+            self._settle()
+            return
+        self.size = min(self.size * 2, self.max_size)
+        print(f"[caption] batch size -> {self.size}")
+
+    def _settle(self) -> None:
+        self.settled = True
+        if not self.state_path:
+            return
+        state = load_json(self.state_path) if self.state_path.exists() else {}
+        state[self.key] = self.size
+        save_json_atomic(state, self.state_path)
@@ -0,0 +1,50 @@
+"""Content-addressed caption cache shared across datasets and runs.
+
+The captions journal is keyed by file name, so the same Wikimedia image
+crawled for MKG-W, MKG-Y and DB15K (or re-downloaded under another
+`QID_idx.jpg`) would be captioned again. This cache is keyed by the image
+bytes plus everything that determines the caption (backend, model, prompt,
+max_new_tokens) and is stored as an append-only JSONL file.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+from pathlib import Path
+
+from ..utils.jsonl import JsonlWriter, read_jsonl
+from .captioners import Captioner
+
+
+def content_digest(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+class CaptionCache:
+    """`digest -> caption` lookups scoped to one captioner configuration."""
+
+    def __init__(self, path: str | Path, captioner: Captioner):
+        settings = [type(captioner).__name__, captioner.model_name, captioner.prompt, captioner.max_new_tokens]
+        self.namespace = hashlib.sha256(json.dumps(settings).encode("utf-8")).hexdigest()[:16]
+        self._entries = {
+            rec["key"]: rec["caption"]
+            for rec in read_jsonl(path)
+            if rec.get("key", "").startswith(self.namespace)
+        }
+        self._writer = JsonlWriter(path)
+
+    def _key(self, digest: str) -> str:
+        return f"{self.namespace}:{digest}"
+
+    def get(self, digest: str) -> str | None:
+        return self._entries.get(self._key(digest))
+
+    def put(self, digest: str, caption: str) -> None:
+        key = self._key(digest)
+        if key not in self._entries:
+            self._entries[key] = caption
+            self._writer.write({"key": key, "caption": caption})
+
+    def close(self) -> None:
+        self._writer.close()
@@ -10,11 +10,21 @@ Notes:
     as blip2-flan-t5-xxl on consumer GPUs.
   - GIT is a pure captioning model and does not condition on a text prompt;
     the configured prompt is ignored for that backend.
+  - Images are decoded once (no separate verify pass) and downscaled to the
+    backend's processor resolution before batching; JPEGs use reduce-on-decode.
+  - "blip-torchscript" runs a traced (optionally int8) BLIP export on CPU;
+    see `export.py` for how to produce one and its parity guarantees.
+  - BLIP-2 and LLaVA tokenise their fixed prompt once at load time; batches
+    only run the image processor and tile the cached token ids. A shared
+    prompt-prefix KV cache is not possible here: LLaVA's prompt text follows
+    the image tokens and BLIP-2 prepends the query embeddings, so no prompt
+    prefix is independent of the image.
 """
 
 from __future__ import annotations
 
 from pathlib import Path
+from typing import BinaryIO
 
 import torch
 from PIL import Image, ImageFile
@@ -41,6 +51,8 @@ def _model_kwargs(quantization: str, dtype: str, device: str) -> dict:
 class Captioner:
     """Base class: load once, caption image batches deterministically."""
 
+    supports_continuous = False  # see continuous.ContinuousCaptioner
+
     def __init__(
         self,
         model_name: str,
@@ -52,6 +64,7 @@ class Captioner:
     ):
         self.model_name = model_name
         self.device = device
+        self.quantization = quantization
         self.max_new_tokens = max_new_tokens
         self.prompt = prompt
         self._load(_model_kwargs(quantization, dtype, device))
@@ -59,9 +72,38 @@ class Captioner:
     def _load(self, model_kwargs: dict) -> None:
         raise NotImplementedError
 
+    @property
+    def image_size(self) -> int | None:
+        """Shorter-side resolution the backend's processor resizes images to."""
+        size = getattr(getattr(self.processor, "image_processor", None), "size", None)
+        if size is None or isinstance(size, (int, float)):
+            return int(size) if size else None
+
+        def edge(key: str):  # plain dict on transformers 4, SizeDict (attribute access) on 5
+            return size.get(key) if isinstance(size, dict) else getattr(size, key, None)
+
+        shortest = edge("shortest_edge")
+        if shortest:
+            return int(shortest)
+        height, width = edge("height"), edge("width")
+        return int(min(height, width)) if height and width else None
+
     def caption_batch(self, images: list[Image.Image]) -> list[str]:
         raise NotImplementedError
 
+    def _cache_prompt(self, text: str) -> None:
+        """Tokenise the fixed prompt once (incl. any image-token expansion)."""
+        dummy = Image.new("RGB", (224, 224))  # the processor resizes it; only the text ids are kept
+        encoded = self.processor(images=[dummy], text=[text], return_tensors="pt")
+        self._prompt_inputs = {key: value for key, value in encoded.items() if key != "pixel_values"}
+
+    def _prompted_inputs(self, images: list[Image.Image]):
+        from transformers import BatchFeature
+
+        inputs = {key: value.repeat(len(images), 1) for key, value in self._prompt_inputs.items()}
+        inputs["pixel_values"] = self.processor.image_processor(images, return_tensors="pt")["pixel_values"]
+        return BatchFeature(inputs).to(self.model.device)
+
     def _generate(self, inputs) -> list[str]:
         with torch.inference_mode():
             generated = self.model.generate(**inputs, max_new_tokens=self.max_new_tokens)
@@ -77,12 +119,10 @@ class Blip2Captioner(Captioner):
         if model_kwargs.get("device_map") is None:
             self.model.to(self.device)
         self.model.eval()
+        self._cache_prompt(self.prompt)
 
     def caption_batch(self, images: list[Image.Image]) -> list[str]:
-        inputs = self.processor(
-            images=images, text=[self.prompt] * len(images), return_tensors="pt", padding=True
-        ).to(self.model.device)
-        return self._generate(inputs)
+        return self._generate(self._prompted_inputs(images))
 
 
 class GitCaptioner(Captioner):
@@ -101,6 +141,8 @@ class GitCaptioner(Captioner):
 
 
 class LlavaCaptioner(Captioner):
+    supports_continuous = True
+
     def _load(self, model_kwargs: dict) -> None:
         from transformers import AutoProcessor, LlavaForConditionalGeneration
 
@@ -109,16 +151,15 @@ class LlavaCaptioner(Captioner):
         if model_kwargs.get("device_map") is None:
             self.model.to(self.device)
         self.model.eval()
+        self._cache_prompt(f"USER: <image>\n{self.prompt} ASSISTANT:")
 
     def caption_batch(self, images: list[Image.Image]) -> list[str]:
-        chat = f"USER: <image>\n{self.prompt} ASSISTANT:"
-        inputs = self.processor(
-            images=images, text=[chat] * len(images), return_tensors="pt", padding=True
-        ).to(self.model.device)
+        inputs = self._prompted_inputs(images)
         with torch.inference_mode():
             generated = self.model.generate(**inputs, max_new_tokens=self.max_new_tokens)
-        texts = self.processor.batch_decode(generated, skip_special_tokens=True)
-        return [text.rsplit("ASSISTANT:", 1)[-1].strip() for text in texts]
+        # identical prompts need no padding, so the reply starts at the same offset in every row
+        response = generated[:, inputs["input_ids"].shape[-1] :]
+        return [text.strip() for text in self.processor.batch_decode(response, skip_special_tokens=True)]
 
 
 class BlipCaptioner(Captioner):
@@ -138,11 +179,45 @@ class BlipCaptioner(Captioner):
         return self._generate(inputs)
 
 
+class BlipTorchScriptCaptioner(Captioner):
+    """CPU runtime for a BLIP export from `export.export_blip`; `model_name` is the export folder."""
+
+    def _load(self, model_kwargs: dict) -> None:
+        import json
+
+        from transformers import BlipProcessor
+
+        from .export import EXPORT_META
+
+        export_dir = Path(self.model_name)
+        self.processor = BlipProcessor.from_pretrained(export_dir)
+        self.vision = torch.jit.load(export_dir / "vision.pt", map_location="cpu")
+        self.decoder = torch.jit.load(export_dir / "decoder.pt", map_location="cpu")
+        self.meta = json.loads((export_dir / EXPORT_META).read_text(encoding="utf-8"))
+
+    def caption_batch(self, images: list[Image.Image]) -> list[str]:
+        pixel_values = self.processor(images=images, return_tensors="pt")["pixel_values"]
+        bos, sep, pad = self.meta["bos_token_id"], self.meta["sep_token_id"], self.meta["pad_token_id"]
+        with torch.inference_mode():
+            image_embeds = self.vision(pixel_values)
+            ids = torch.full((len(images), 1), bos, dtype=torch.long)
+            finished = torch.zeros(len(images), dtype=torch.bool)
+            for _ in range(self.max_new_tokens):
+                next_ids = self.decoder(ids, image_embeds).argmax(-1)
+                next_ids = torch.where(finished, torch.full_like(next_ids, pad), next_ids)
+                ids = torch.cat([ids, next_ids[:, None]], dim=1)
+                finished |= next_ids == sep
+                if finished.all():
+                    break
+        return [text.strip() for text in self.processor.batch_decode(ids, skip_special_tokens=True)]
+
+
 _BACKENDS = {
     "blip2": Blip2Captioner,
     "git": GitCaptioner,
     "llava": LlavaCaptioner,
     "blip": BlipCaptioner,
+    "blip-torchscript": BlipTorchScriptCaptioner,
 }
 
 
@@ -160,11 +235,22 @@ def build_captioner(cfg: dict, device: str) -> Captioner:
     )
 
 
-def load_image(path: str | Path) -> Image.Image | None:
-    """Open + verify an image, returning None (not raising) on corrupt files."""
+def load_image(path: str | Path | BinaryIO, max_size: int | None = None) -> Image.Image | None:
+    """Decode an image in one pass, returning None (not raising) on corrupt files.
+
+    With `max_size`, the image is shrunk so its shorter side is `max_size`
+    (never upscaled); JPEGs are decoded directly at a reduced DCT scale.
+    """
     try:
-        with Image.open(path) as probe:
-            probe.verify()
-        return Image.open(path).convert("RGB")
+        with Image.open(path) as image:
+            if max_size and min(image.size) > max_size:
+                scale = max_size / min(image.size)
+                target = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+                image.draft("RGB", target)
+                image = image.convert("RGB")
+                if min(image.size) > max_size:
+                    image = image.resize(target, Image.BICUBIC, reducing_gap=3.0)
+                return image
+            return image.convert("RGB")
     except Exception:
         return None
@@ -0,0 +1,148 @@
+"""Continuous-batching caption engine for decoder-only captioners (LLaVA).
+
+`model.generate` keeps a batch alive until its longest caption finishes, so
+with `max_new_tokens: 100` most rows decode padding for most of the batch.
+`ContinuousCaptioner` runs its own greedy decode loop over a fixed number of
+slots instead: a row leaves as soon as it emits EOS (or hits
+`max_new_tokens`) and new images are prefilled and slotted into the running
+batch.
+
+Every row shares the same cached prompt, so all prefills have the same
+length; rows differ only in how many tokens they have generated. New rows
+are left-padded into the shared KV cache and masked out, with explicit
+position ids, exactly like left-padded batched generation. Leading columns
+that are padding for every row are trimmed after evictions.
+
+Decoding is greedy (the captioners' default); for a single image it yields
+the same tokens as `model.generate(do_sample=False)` up to floating-point
+differences caused by padding.
+"""
+
+from __future__ import annotations
+
+from itertools import islice
+from typing import Iterable, Iterator, TypeVar
+
+import torch
+from PIL import Image
+
+from .captioners import Captioner
+
+K = TypeVar("K")
+
+
+class ContinuousCaptioner:
+    """Caption a stream of `(key, image)` pairs, yielding `(key, caption)` as rows finish."""
+
+    def __init__(self, captioner: Captioner, slots: int = 16, refill: int | None = None):
+        if not getattr(captioner, "supports_continuous", False):
+            raise ValueError(f"{type(captioner).__name__} does not support continuous batching")
+        self.captioner = captioner
+        self.model = captioner.model
+        self.slots = slots
+        # admit new rows in groups so each prefill is itself a reasonable batch
+        self.refill = refill or max(1, slots // 4)
+        eos = self.model.generation_config.eos_token_id
+        self.eos_ids = set(eos if isinstance(eos, list) else [eos]) - {None}
+
+    def caption_stream(self, stream: Iterable[tuple[K, Image.Image]]) -> Iterator[tuple[K, str]]:
+        source = iter(stream)
+        keys: list = []
+        tokens: list[list[int]] = []
+        cache, mask, last = None, None, None
+        exhausted = False
+        with torch.inference_mode():
+            while True:
+                free = self.slots - len(keys)
+                if not exhausted and (free >= self.refill or not keys):
+                    incoming = list(islice(source, free))
+                    exhausted = len(incoming) < free
+                    if incoming:
+                        cache, mask, last = self._admit(incoming, keys, tokens, cache, mask, last)
+                finished = [i for i, row in enumerate(tokens) if self._is_done(row)]
+                if finished:
+                    for i in finished:
+                        yield keys[i], self._decode(tokens[i])
+                    keep = [i for i in range(len(keys)) if i not in set(finished)]
+                    keys = [keys[i] for i in keep]
+                    tokens = [tokens[i] for i in keep]
+                    if not keys:
+                        cache, mask, last = None, None, None
+                        if exhausted:
+                            return
+                        continue
+                    cache, mask, last = self._evict(keep, cache, mask, last)
+                    continue  # refill freed slots before the next step
+                if not keys:
+                    return
+                cache, mask, last = self._step(cache, mask, last)
+                for row, token in zip(tokens, last[:, 0].tolist()):
+                    row.append(token)
+
+    def _is_done(self, row: list[int]) -> bool:
+        return row[-1] in self.eos_ids or len(row) >= self.captioner.max_new_tokens
+
+    def _decode(self, row: list[int]) -> str:
+        if row and row[-1] in self.eos_ids:
+            row = row[:-1]
+        return self.captioner.processor.decode(row, skip_special_tokens=True).strip()
+
+    def _admit(self, incoming, keys, tokens, cache, mask, last):
+        inputs = self.captioner._prompted_inputs([image for _, image in incoming])
+        out = self.model(**inputs, use_cache=True)
+        first = out.logits[:, -1].argmax(-1, keepdim=True)
+        new_mask = inputs["attention_mask"]
+        keys.extend(key for key, _ in incoming)
+        tokens.extend([token] for token in first[:, 0].tolist())
+        if cache is None:
+            return out.past_key_values, new_mask, first
+
+        width = max(mask.shape[1], new_mask.shape[1])
+        mask = torch.cat([_pad_left(mask, width), _pad_left(new_mask, width)])
+        cache = _rebuild(
+            cache,
+            lambda old, new: torch.cat([_pad_left(old, width, dim=-2), _pad_left(new, width, dim=-2)]),
+            out.past_key_values,
+        )
+        return cache, mask, torch.cat([last, first])
+
+    def _evict(self, keep: list[int], cache, mask, last):
+        index = torch.tensor(keep, device=mask.device)
+        mask = mask.index_select(0, index)
+        leading = int((mask.cumsum(-1) == 0).sum(-1).min())  # all-padding columns
+        mask = mask[:, leading:]
+        cache = _rebuild(cache, lambda old: old.index_select(0, index.to(old.device))[:, :, leading:])
+        return cache, mask, last.index_select(0, index)
+
+    def _step(self, cache, mask, last):
+        positions = mask.sum(-1, keepdim=True)
+        mask = torch.cat([mask, mask.new_ones(mask.shape[0], 1)], dim=-1)
+        out = self.model(
+            input_ids=last,
+            attention_mask=mask,
+            position_ids=positions,
+            past_key_values=cache,
+            use_cache=True,
+        )
+        return out.past_key_values, mask, out.logits[:, -1].argmax(-1, keepdim=True)
+
+
+def _pad_left(tensor: torch.Tensor, width: int, dim: int = -1) -> torch.Tensor:
+    missing = width - tensor.shape[dim]
+    if missing <= 0:
+        return tensor
+    shape = list(tensor.shape)
+    shape[dim] = missing
+    return torch.cat([tensor.new_zeros(shape), tensor], dim=dim)
+
+
+def _rebuild(cache, fn, other=None):
+    from transformers import DynamicCache
+
+    layers = []
+    for i, layer in enumerate(cache.layers):
+        if other is None:
+            layers.append((fn(layer.keys), fn(layer.values)))
+        else:
+            layers.append((fn(layer.keys, other.layers[i].keys), fn(layer.values, other.layers[i].values)))
+    return DynamicCache(layers)
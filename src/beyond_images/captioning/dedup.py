@@ -0,0 +1,46 @@
+"""Near-duplicate detection before captioning.
+
+Wikipedia pages often embed the same photo at several sizes or encodings,
+and each copy would otherwise be captioned separately. Each decoded image
+gets a 64-bit difference hash (dHash). Within one QID, an image whose hash
+is within `max_distance` bits of an earlier representative is not
+captioned. The representative's caption is written for it instead, with a
+`duplicate_of` field in the journal.
+"""
+
+from __future__ import annotations
+
+from collections import defaultdict
+from pathlib import Path
+
+from PIL import Image
+
+
+def dhash(image: Image.Image, hash_size: int = 8) -> int:
+    """Difference hash: sign of horizontal gradients on a tiny grayscale copy."""
+    small = image.convert("L").resize((hash_size + 1, hash_size), Image.BILINEAR)
+    pixels = small.tobytes()
+    bits = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            bits = (bits << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return bits
+
+
+class NearDuplicateIndex:
+    """Per-QID representatives keyed by dHash."""
+
+    def __init__(self, max_distance: int = 6):
+        self.max_distance = max_distance
+        self._groups: dict[str, list[tuple[int, str]]] = defaultdict(list)
+
+    def match(self, name: str, image: Image.Image) -> str | None:
+        """Return the representative `name` duplicates, or register it as a new one."""
+        qid = Path(name).stem.split("_", 1)[0]
+        value = dhash(image)
+        for rep_hash, rep_name in self._groups[qid]:
+            if (value ^ rep_hash).bit_count() <= self.max_distance:
+                return rep_name
+        self._groups[qid].append((value, name))
+        return None
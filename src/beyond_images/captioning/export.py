@@ -0,0 +1,125 @@
+"""TorchScript CPU export of the BLIP captioner, with optional int8 weights.
+
+`export_blip` traces the two halves of `BlipForConditionalGeneration`:
+  - `vision.pt`:  pixel_values -> image embeddings,
+  - `decoder.pt`: (input_ids, image embeddings) -> next-token logits,
+and saves them next to the processor and an `export.json` with the special
+token ids. `captioning.backend: blip-torchscript` with `captioning.model`
+pointing at the export folder then captions with the traced graphs
+(`BlipTorchScriptCaptioner`).
+
+`quantize=True` applies PyTorch dynamic int8 quantization to every Linear
+layer before tracing: roughly 4x smaller weights and faster CPU matmuls.
+
+Parity: the float32 export decodes greedily like the eager model. It
+recomputes the full prefix at every step instead of reusing a KV cache, so
+logits can differ in the last float bits and a caption may change only
+where two tokens are tied. Int8 exports do not match exactly;
+`check_parity` reports the fraction of identical captions and the mean
+word agreement so a quantized export can be accepted against a tolerance,
+plus the wall time of both paths: without a KV cache the export only pays
+off where graph execution (and int8 weights) outweigh re-running the
+prefix, so measure it on the target host.
+
+GIT is not exported: `GitForCausalLM` has no entry point for precomputed
+image features, so its decoder cannot be traced separately from the image
+encoder without re-implementing the model's attention mask.
+"""
+
+from __future__ import annotations
+
+import json
+import time
+from pathlib import Path
+
+import torch
+from PIL import Image
+
+EXPORT_META = "export.json"
+
+
+class _VisionEncoder(torch.nn.Module):
+    def __init__(self, vision_model):
+        super().__init__()
+        self.vision_model = vision_model
+
+    def forward(self, pixel_values: torch.Tensor) -> torch.Tensor:
+        return self.vision_model(pixel_values=pixel_values)[0]
+
+
+class _DecoderStep(torch.nn.Module):
+    def __init__(self, text_decoder):
+        super().__init__()
+        self.text_decoder = text_decoder
+
+    def forward(self, input_ids: torch.Tensor, image_embeds: torch.Tensor) -> torch.Tensor:
+        out = self.text_decoder(input_ids=input_ids, encoder_hidden_states=image_embeds, use_cache=False)
+        return out.logits[:, -1]
+
+
+def export_blip(model_name: str, output_dir: str | Path, quantize: bool = False) -> Path:
+    from transformers import AutoConfig, BlipForConditionalGeneration, BlipProcessor
+
+    model_type = AutoConfig.from_pretrained(model_name).model_type
+    if model_type != "blip":
+        raise ValueError(f"{model_name} is a {model_type!r} checkpoint; only BLIP-1 ('blip') can be exported")
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    processor = BlipProcessor.from_pretrained(model_name)
+    model = BlipForConditionalGeneration.from_pretrained(model_name, dtype=torch.float32).eval()
+    if quantize:
+        model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+    text_cfg = model.config.text_config
+    pixel_values = processor(images=[Image.new("RGB", (384, 384))] * 2, return_tensors="pt")["pixel_values"]
+    with torch.no_grad():
+        vision = torch.jit.trace(_VisionEncoder(model.vision_model), (pixel_values,), check_trace=False)
+        image_embeds = vision(pixel_values)
+        example_ids = torch.tensor([[text_cfg.bos_token_id, text_cfg.pad_token_id]] * 2)
+        decoder = torch.jit.trace(_DecoderStep(model.text_decoder), (example_ids, image_embeds), check_trace=False)
+    torch.jit.save(vision, output_dir / "vision.pt")
+    torch.jit.save(decoder, output_dir / "decoder.pt")
+    processor.save_pretrained(output_dir)
+    meta = {
+        "source_model": model_name,
+        "quantized": quantize,
+        "bos_token_id": text_cfg.bos_token_id,
+        "sep_token_id": text_cfg.sep_token_id,
+        "pad_token_id": text_cfg.pad_token_id,
+    }
+    (output_dir / EXPORT_META).write_text(json.dumps(meta, indent=4), encoding="utf-8")
+    print(f"[export] wrote {output_dir} (quantized={quantize})")
+    return output_dir
+
+
+def check_parity(
+    eager_captioner,
+    exported_captioner,
+    images: list[Image.Image],
+    batch_size: int = 8,
+) -> dict[str, float]:
+    """Caption `images` with both captioners; compare the outputs and the time each took."""
+    identical, agreement = 0, 0.0
+    eager_sec = export_sec = 0.0
+    for start in range(0, len(images), batch_size):
+        batch = images[start : start + batch_size]
+        started = time.perf_counter()
+        reference = eager_captioner.caption_batch(batch)
+        eager_sec += time.perf_counter() - started
+        started = time.perf_counter()
+        exported = exported_captioner.caption_batch(batch)
+        export_sec += time.perf_counter() - started
+        for ref, got in zip(reference, exported):
+            identical += ref == got
+            ref_words, got_words = ref.split(), got.split()
+            matches = sum(a == b for a, b in zip(ref_words, got_words))
+            agreement += matches / max(len(ref_words), len(got_words), 1)
+    count = max(len(images), 1)
+    return {
+        "images": len(images),
+        "identical": identical / count,
+        "word_agreement": agreement / count,
+        "eager_sec": round(eager_sec, 3),
+        "export_sec": round(export_sec, 3),
+        "speedup": round(eager_sec / max(export_sec, 1e-9), 2),
+    }
@@ -1,21 +1,98 @@
-"""Caption every image in a folder, writing an incremental JSONL journal.
+"""Caption every image in a folder or archive, writing an incremental JSONL journal.
 
 Fixes over the original 4.x scripts:
   - sorted, deterministic file order (os.listdir order is arbitrary),
   - resume: images already present in the output journal are skipped,
     instead of appending duplicate lines on re-runs,
-  - corrupt images are skipped per-image, not per-batch.
+  - corrupt images are skipped per-image, not per-batch,
+  - images are read and decoded on a thread pool up to `prefetch` batches
+    ahead, so PIL decoding overlaps with generation instead of stalling the model,
+  - optional adaptive batch sizing (see `batching.AdaptiveBatcher`),
+  - optional content-hash caption cache shared across datasets and runs
+    (see `cache.CaptionCache`); cache hits are never decoded or captioned,
+  - tar/zip shards are streamed member by member (see `sources`),
+  - optional continuous batching for LLaVA (see `continuous`),
+  - optional near-duplicate grouping per QID (see `dedup`): one image per
+    group is captioned and its caption is fanned out to the others.
 """
 
 from __future__ import annotations
 
+import concurrent.futures as cf
+import io
 import time
+from collections import deque
+from itertools import islice
 from pathlib import Path
+from typing import Callable, Iterable, Iterator, TypeVar
+
+from PIL import Image
 
 from ..utils.jsonl import JsonlWriter, completed_keys
+from .batching import AdaptiveBatcher
+from .cache import CaptionCache, content_digest
 from .captioners import Captioner, load_image
+from .continuous import ContinuousCaptioner
+from .dedup import NearDuplicateIndex
+from .shards import shard_of
+from .sources import ArchiveMember, iter_images, read_bytes
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+def prefetch_batches(
+    items: Iterable[T],
+    batch_size: int,
+    load: Callable[[T], R],
+    prefetch: int = 2,
+    workers: int = 4,
+) -> Iterator[tuple[list[T], list[R]]]:
+    """Yield `(items, loaded)` batches, loading up to `prefetch` batches ahead.
+
+    A bounded producer/consumer window: at most `prefetch + 1` batches are in
+    flight, so memory stays proportional to the batch size. `items` is consumed
+    lazily, so streamed archives are never materialised. `prefetch=0` loads
+    serially on the calling thread.
+    """
+    source = iter(items)
+    batches = iter(lambda: list(islice(source, batch_size)), [])
+    if prefetch <= 0:
+        for batch in batches:
+            yield batch, [load(item) for item in batch]
+        return
+
+    with cf.ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        pending: deque = deque()
 
-IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".gif", ".bmp", ".webp"}
+        def submit_next() -> None:
+            batch = next(batches, None)
+            if batch is not None:
+                pending.append((batch, [pool.submit(load, item) for item in batch]))
+
+        for _ in range(prefetch + 1):
+            submit_next()
+        while pending:
+            batch, futures = pending.popleft()
+            submit_next()
+            yield batch, [future.result() for future in futures]
+
+
+def _prepare(
+    item: Path | ArchiveMember,
+    max_size: int | None,
+    cache: CaptionCache | None,
+) -> tuple[str | None, str | None, Image.Image | None]:
+    """Read an item once; return `(digest, cached_caption, image)`."""
+    try:
+        data = read_bytes(item)
+    except OSError:
+        return None, None, None
+    digest = content_digest(data) if cache else None
+    cached = cache.get(digest) if cache else None
+    if cached is not None:
+        return digest, cached, None
+    return digest, None, load_image(io.BytesIO(data), max_size=max_size)
 
 
 def caption_folder(
@@ -24,41 +101,148 @@ def caption_folder(
     output_jsonl: str | Path,
     batch_size: int = 8,
     limit: int | None = None,
+    prefetch: int = 2,
+    decode_workers: int = 4,
+    downscale: bool = True,
+    adaptive_batching: bool = False,
+    max_batch_size: int = 64,
+    batch_state: str | Path | None = None,
+    cache_path: str | Path | None = None,
+    shard: tuple[int, int] | None = None,
+    runner: str = "batch",
+    slots: int = 16,
+    near_duplicate_bits: int | None = None,
 ) -> dict[str, int]:
-    image_dir = Path(image_dir)
-    files = sorted(
-        p for p in image_dir.iterdir() if p.suffix.lower() in IMAGE_EXTENSIONS
-    )
+    """Caption a folder of images, one tar/zip archive, or a folder of archives.
+
+    `runner="batch"` captions each prefetched batch with `caption_batch`;
+    `runner="continuous"` streams images through a `ContinuousCaptioner`
+    with `slots` concurrent sequences (decoder-only backends only).
+    """
+    if runner not in ("batch", "continuous"):
+        raise ValueError(f"Unknown caption runner {runner!r}; choose batch or continuous")
+    items, count = iter_images(image_dir)
     if limit:
-        files = files[:limit]
+        items = islice(items, limit)
+    if shard:
+        index, num_shards = shard
+        items = (item for item in items if shard_of(item.name, num_shards) == index)
 
     done = completed_keys(output_jsonl, "image")
-    todo = [p for p in files if p.name not in done]
-    print(f"[caption] {len(files)} images, {len(done)} done, {len(todo)} to caption")
+    stats = {"images": 0, "captioned": 0, "skipped_corrupt": 0}
+
+    def pending_items() -> Iterator[Path | ArchiveMember]:
+        for item in items:
+            stats["images"] += 1
+            if item.name not in done:
+                yield item
+
+    if count is None:
+        todo: Iterable[Path | ArchiveMember] = pending_items()
+        total = None
+        print(f"[caption] streaming archives from {image_dir}, {len(done)} done")
+    else:
+        todo = list(pending_items())
+        total = len(todo)
+        print(f"[caption] {stats['images']} images, {stats['images'] - total} done, {total} to caption")
+
+    caption_batch = captioner.caption_batch
+    if adaptive_batching:
+        caption_batch = AdaptiveBatcher(
+            captioner.caption_batch,
+            key=f"{type(captioner).__name__}:{captioner.model_name}:{captioner.quantization}:{captioner.device}",
+            start_size=batch_size,
+            max_size=max_batch_size,
+            state_path=batch_state,
+            mode="memory" if captioner.device.startswith("cuda") else "throughput",
+        )
+        batch_size = max_batch_size  # decode in max-size chunks; the batcher splits them
+
+    cache = CaptionCache(cache_path, captioner) if cache_path else None
+    if cache:
+        stats.update(cache_hits=0, cache_misses=0)
+    max_size = captioner.image_size if downscale else None
+    duplicates = NearDuplicateIndex(near_duplicate_bits) if near_duplicate_bits is not None else None
+    followers: dict[str, list[Path | ArchiveMember]] = {}  # representatives still in flight
+    rep_captions: dict[str, str] = {}  # representatives already recorded
+    if duplicates:
+        stats["near_duplicates"] = 0
 
-    stats = {"images": len(files), "captioned": 0, "skipped_corrupt": 0}
     started = time.time()
+    done_count = 0
+    batches = prefetch_batches(
+        todo,
+        batch_size,
+        load=lambda item: _prepare(item, max_size, cache),
+        prefetch=prefetch,
+        workers=decode_workers,
+    )
     with JsonlWriter(output_jsonl) as writer:
-        for start in range(0, len(todo), batch_size):
-            batch_paths = todo[start : start + batch_size]
-            batch_images, kept_paths = [], []
-            for path in batch_paths:
-                image = load_image(path)
-                if image is None:
-                    stats["skipped_corrupt"] += 1
-                    writer.write({"image": path.name, "caption": None, "corrupt": True})
-                    continue
-                batch_images.append(image)
-                kept_paths.append(path)
-            if not batch_images:
-                continue
-            captions = captioner.caption_batch(batch_images)
-            for path, caption in zip(kept_paths, captions):
-                writer.write({"image": path.name, "caption": caption})
-                stats["captioned"] += 1
-            done_count = start + len(batch_paths)
+
+        def model_batches() -> Iterator[tuple[list, list[Image.Image]]]:
+            """Journal cache hits and corrupt files; yield what needs the model."""
+            nonlocal done_count
+            for batch_items, prepared in batches:
+                done_count += len(batch_items)
+                batch_images, kept = [], []
+                for item, (digest, cached, image) in zip(batch_items, prepared):
+                    if cached is not None:
+                        writer.write({"image": item.name, "caption": cached, "cached": True})
+                        stats["captioned"] += 1
+                        stats["cache_hits"] += 1
+                        continue
+                    if image is None:
+                        stats["skipped_corrupt"] += 1
+                        writer.write({"image": item.name, "caption": None, "corrupt": True})
+                        continue
+                    if duplicates:
+                        rep = duplicates.match(item.name, image)
+                        if rep is not None:
+                            stats["near_duplicates"] += 1
+                            if rep in rep_captions:
+                                write_duplicate(item, rep, rep_captions[rep])
+                            else:
+                                followers.setdefault(rep, []).append(item)
+                            continue
+                    if cache:
+                        stats["cache_misses"] += 1
+                    batch_images.append(image)
+                    kept.append((item, digest))
+                if batch_images:
+                    yield kept, batch_images
+
+        def write_duplicate(item: Path | ArchiveMember, rep: str, caption: str) -> None:
+            writer.write({"image": item.name, "caption": caption, "duplicate_of": rep})
+            stats["captioned"] += 1
+
+        def record(item: Path | ArchiveMember, digest: str | None, caption: str) -> None:
+            writer.write({"image": item.name, "caption": caption})
+            stats["captioned"] += 1
+            if cache and digest:
+                cache.put(digest, caption)
+            if duplicates:
+                rep_captions[item.name] = caption
+                for duplicate in followers.pop(item.name, []):
+                    write_duplicate(duplicate, item.name, caption)
+
+        def report() -> None:
             rate = stats["captioned"] / max(time.time() - started, 1e-6)
-            print(f"[caption] {done_count}/{len(todo)} ({rate:.1f} img/s)")
+            print(f"[caption] {done_count}/{total or '?'} ({rate:.1f} img/s)")
+
+        if runner == "continuous":
+            engine = ContinuousCaptioner(captioner, slots=slots)
+            stream = (entry for kept, images in model_batches() for entry in zip(kept, images))
+            for idx, ((item, digest), caption) in enumerate(engine.caption_stream(stream), 1):
+                record(item, digest, caption)
+                if idx % slots == 0:
+                    report()
+        else:
+            for kept, images in model_batches():
+                for (item, digest), caption in zip(kept, caption_batch(images)):
+                    record(item, digest, caption)
+                report()
+    if cache:
+        cache.close()
     return stats
 
 
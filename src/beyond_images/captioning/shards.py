@@ -0,0 +1,102 @@
+"""Data-parallel captioning: one worker process per device or CPU slice.
+
+`caption --workers N` re-launches the CLI N times with `--shard i/N`. Each
+worker captions the images whose QID (`Q42` in `Q42_1.jpg`) hashes to shard
+`i` (`shard_of`), so all images of an entity land in the same worker and
+near-duplicate grouping (`dedup`) still sees the whole group. Each worker
+writes its own journal (`<output>.shard-i-of-N.jsonl`), then the launcher
+appends every new record to the single captions JSONL that `merge_captions`
+expects.
+
+Workers are pinned with CUDA_VISIBLE_DEVICES (round-robin over the GPUs the
+launcher itself may use) or, on CPU, to a contiguous slice of the allowed
+cores with a matching OMP_NUM_THREADS. Shard journals are kept, so re-running
+resumes every shard; the launcher exits non-zero if any shard failed.
+"""
+
+from __future__ import annotations
+
+import os
+import subprocess
+import sys
+import zlib
+from pathlib import Path
+
+from ..utils.jsonl import JsonlWriter, completed_keys, read_jsonl
+
+
+def parse_shard(spec: str) -> tuple[int, int]:
+    """Parse `i/N` into (index, count) with 0 <= index < count."""
+    index, _, count = spec.partition("/")
+    try:
+        index, count = int(index), int(count)
+    except ValueError:
+        raise ValueError(f"--shard must look like i/N, got: {spec!r}") from None
+    if not 0 <= index < count:
+        raise ValueError(f"--shard index must be in [0, {count}), got: {spec!r}")
+    return index, count
+
+
+def shard_of(name: str, count: int) -> int:
+    """Shard index of an image: a stable hash of its QID, so an entity never spans shards."""
+    qid = Path(name).stem.split("_", 1)[0]
+    return zlib.crc32(qid.encode("utf-8")) % count
+
+
+def shard_journal(output_jsonl: str | Path, index: int, count: int) -> Path:
+    output_jsonl = Path(output_jsonl)
+    return output_jsonl.with_name(f"{output_jsonl.stem}.shard-{index}-of-{count}{output_jsonl.suffix}")
+
+
+def worker_env(index: int, count: int) -> tuple[dict[str, str], set[int] | None]:
+    """Environment and CPU set that pin worker `index` of `count` to a GPU or a core slice."""
+    env = dict(os.environ)
+    try:
+        import torch
+
+        gpus = torch.cuda.device_count()
+    except ImportError:
+        gpus = 0
+    if gpus:
+        # index into the devices this process may use, not physical ids (a parent limited to "4,5" stays there)
+        visible = [dev.strip() for dev in os.environ.get("CUDA_VISIBLE_DEVICES", "").split(",") if dev.strip()]
+        env["CUDA_VISIBLE_DEVICES"] = visible[index % len(visible)] if visible else str(index % gpus)
+        return env, None
+    threads, cpus = cpu_slice(index, count)
+    env["OMP_NUM_THREADS"] = str(threads)
+    return env, cpus
+
+
+def cpu_slice(index: int, count: int) -> tuple[int, set[int] | None]:
+    """Thread count and contiguous slice of the allowed cores for CPU worker `index` of `count`."""
+    cores = sorted(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else []
+    per_worker = max(1, len(cores) // count) if cores else max(1, (os.cpu_count() or 1) // count)
+    cpus = set(cores[index * per_worker : (index + 1) * per_worker]) if cores else None
+    return per_worker, cpus or None
+
+
+def launch_shards(child_args: list[str], count: int) -> list[int]:
+    """Run `python -m beyond_images <child_args> --shard i/count` for every i; return exit codes."""
+    procs = []
+    for index in range(count):
+        env, cpus = worker_env(index, count)
+        pin = (lambda cpus=cpus: os.sched_setaffinity(0, cpus)) if cpus else None
+        cmd = [sys.executable, "-m", "beyond_images", *child_args, "--shard", f"{index}/{count}"]
+        print(f"[caption] launching shard {index}/{count}")
+        procs.append(subprocess.Popen(cmd, env=env, preexec_fn=pin))
+    return [proc.wait() for proc in procs]
+
+
+def merge_shard_journals(output_jsonl: str | Path, count: int) -> int:
+    """Append shard records not yet in `output_jsonl`; return how many were added."""
+    done = completed_keys(output_jsonl, "image")
+    added = 0
+    with JsonlWriter(output_jsonl) as writer:
+        for index in range(count):
+            for rec in read_jsonl(shard_journal(output_jsonl, index, count)):
+                if rec.get("image") in done:
+                    continue
+                writer.write(rec)
+                done.add(rec["image"])
+                added += 1
+    return added
@@ -0,0 +1,67 @@
+"""Image sources for captioning: loose folders and tar/zip archives.
+
+A source is either a directory of images, a single `.tar`/`.tar.gz`/`.tgz`/
+`.zip` archive, or a directory of such archives (WebDataset-style shards).
+Archive members are streamed in archive order and keyed by their base file
+name, so journals keep the `QID_idx.jpg` naming of loose files. Streaming
+avoids listing and opening hundreds of thousands of small files on network
+filesystems.
+"""
+
+from __future__ import annotations
+
+import tarfile
+import zipfile
+from pathlib import Path
+from typing import Iterator, NamedTuple
+
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".gif", ".bmp", ".webp"}
+ARCHIVE_SUFFIXES = (".tar", ".tar.gz", ".tgz", ".zip")
+
+
+class ArchiveMember(NamedTuple):
+    name: str
+    data: bytes
+
+
+def is_archive(path: Path) -> bool:
+    return path.is_file() and path.name.lower().endswith(ARCHIVE_SUFFIXES)
+
+
+def _is_image(name: str) -> bool:
+    return Path(name).suffix.lower() in IMAGE_EXTENSIONS
+
+
+def _iter_archive(path: Path) -> Iterator[ArchiveMember]:
+    if path.name.lower().endswith(".zip"):
+        with zipfile.ZipFile(path) as archive:
+            for info in archive.infolist():
+                if not info.is_dir() and _is_image(info.filename):
+                    yield ArchiveMember(Path(info.filename).name, archive.read(info))
+        return
+    with tarfile.open(path, "r|*") as archive:  # stream mode: sequential reads only
+        for member in archive:
+            if member.isfile() and _is_image(member.name):
+                fh = archive.extractfile(member)
+                if fh is not None:
+                    yield ArchiveMember(Path(member.name).name, fh.read())
+
+
+def iter_images(source: str | Path) -> tuple[Iterator[Path | ArchiveMember], int | None]:
+    """Return `(items, count)`; `count` is None when archives are streamed.
+
+    Loose files are listed and sorted up front (deterministic order);
+    archives are read lazily, one shard after another in sorted order.
+    """
+    source = Path(source)
+    if is_archive(source):
+        return _iter_archive(source), None
+    archives = sorted(p for p in source.iterdir() if is_archive(p))
+    if archives:
+        return (member for archive in archives for member in _iter_archive(archive)), None
+    files = sorted(p for p in source.iterdir() if p.is_file() and _is_image(p.name))
+    return iter(files), len(files)
+
+
+def read_bytes(item: Path | ArchiveMember) -> bytes:
+    return item.data if isinstance(item, ArchiveMember) else item.read_bytes()
@@ -9,10 +9,17 @@ Stages (in pipeline order):
     consolidate       original per-entity image folders -> flat QID_idx.jpg
     db15k-download    download DB15K images from mmkb URL lists
     crawl             crawl new entity images + metadata from Wikipedia
-    caption           image folder -> captions JSONL (BLIP-2 / GIT / LLaVA)
+    caption           image folder / tar / zip -> captions JSONL (BLIP-2 / GIT / LLaVA;
+                      --workers N for one process per GPU / CPU slice)
+    caption-export    BLIP -> TorchScript (optionally int8) for CPU captioning
     merge             captions + entity links -> per-entity summary JSON
-    fuse              entity summaries -> LLM-fused paragraphs
-    embed             entity JSON -> .h5 / .pth embeddings (+ row manifest)
+    fuse              entity summaries -> LLM-fused paragraphs (--server URL: use a fuse-serve process)
+    fuse-serve        keep a fuser loaded and batch fuse requests over local HTTP
+    fuse-sweep        fuse shared, once-prepared descriptions with every fusion.sweep model
+    embed             entity JSON -> .h5 / .pth / .npy embeddings (+ row manifest);
+                      embedding.incremental re-encodes only changed texts
+    embed-bench       time fixed-row vs token-budget (embedding.max_batch_tokens) batching
+    h5-convert        rewrite an embedding .h5 as per-entity or packed layout
     tokens            entity JSON -> BERT token-id JSON (MyGO format)
     tokens-merge      splice enriched tokens into an existing token file
 """
@@ -20,9 +27,11 @@ Stages (in pipeline order):
 from __future__ import annotations
 
 import argparse
+import io
 import json
 import sys
 import time
+from itertools import islice
 from pathlib import Path
 
 from .config import Config
@@ -80,8 +89,22 @@ def build_parser() -> argparse.ArgumentParser:
     _add_common(p)
 
     p = sub.add_parser("caption", help="Caption an image folder")
-    p.add_argument("--images", required=True)
+    p.add_argument("--images", required=True, help="Image folder, tar/zip archive, or folder of archives")
     p.add_argument("--output", required=True, help="Captions journal JSONL")
+    p.add_argument("--shard", default=None, metavar="I/N", help="Caption only slice I of N (own journal)")
+    p.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="Spawn N shard workers (one per GPU / CPU slice) and merge their journals",
+    )
+    _add_common(p)
+
+    p = sub.add_parser("caption-export", help="Export BLIP to TorchScript for CPU captioning")
+    p.add_argument("--model", required=True, help="BLIP-1 checkpoint, e.g. Salesforce/blip-image-captioning-base")
+    p.add_argument("--output", required=True, help="Export folder (use as captioning.model)")
+    p.add_argument("--quantize", action="store_true", help="Dynamic int8 quantization of Linear layers")
+    p.add_argument("--check", default=None, help="Image folder for an eager-vs-export parity check")
     _add_common(p)
 
     p = sub.add_parser("merge", help="Captions + links -> entity summary JSON")
@@ -94,12 +117,36 @@ def build_parser() -> argparse.ArgumentParser:
     p.add_argument("--inputs", nargs="+", required=True, help="Entity summary JSON file(s)")
     p.add_argument("--journal", required=True)
     p.add_argument("--output", required=True)
+    p.add_argument("--server", default=None, help="URL of a fuse-serve process (default: fusion.server)")
+    _add_common(p)
+
+    p = sub.add_parser("fuse-serve", help="Serve a resident fuser over local HTTP")
+    p.add_argument("--host", default="127.0.0.1")
+    p.add_argument("--port", type=int, default=8765)
+    _add_common(p)
+
+    p = sub.add_parser("fuse-sweep", help="Fuse the same inputs with several models")
+    p.add_argument("--inputs", nargs="+", required=True, help="Entity summary JSON file(s)")
+    p.add_argument("--output-dir", required=True, help="Prepared descriptions, per-model outputs and report")
+    p.add_argument("--workers", type=int, default=1, help="Models fused concurrently, one process each")
+    p.add_argument("--only", default=None, help="Run a single fusion.sweep entry by name")
     _add_common(p)
 
     p = sub.add_parser("embed", help="Entity JSON -> h5/pth embeddings")
     p.add_argument("--input", required=True)
     p.add_argument("--h5", default=None)
     p.add_argument("--pth", default=None)
+    p.add_argument("--npy", default=None, help="Memory-mappable .npy + .entities.txt (EmbeddingStore)")
+    _add_common(p)
+
+    p = sub.add_parser("embed-bench", help="Time fixed-row vs token-budget embedding batches")
+    p.add_argument("--input", required=True)
+    _add_common(p)
+
+    p = sub.add_parser("h5-convert", help="Convert an embedding .h5 between layouts")
+    p.add_argument("--input", required=True)
+    p.add_argument("--output", required=True)
+    p.add_argument("--layout", choices=["per-entity", "packed"], default="per-entity")
     _add_common(p)
 
     p = sub.add_parser("tokens", help="Entity JSON -> BERT token ids (MyGO)")
@@ -126,6 +173,10 @@ def _load_entities_for_crawl(links_tsv: str) -> list[tuple[str, str]]:
     return entities
 
 
+def _chunk_tokens(cfg: Config) -> int | None:
+    return cfg.get("fusion.chunk_tokens") if cfg.get("fusion.hierarchical", False) else None
+
+
 def main(argv: list[str] | None = None) -> int:
     args = build_parser().parse_args(argv)
     cfg = Config.load(args.config, overrides=args.set)
@@ -137,6 +188,7 @@ def main(argv: list[str] | None = None) -> int:
 
     started = time.time()
     stats: dict = {}
+    exit_code = 0
 
     if args.stage == "links-transform":
         from .retrieval.entity_links import transform_sameas_links
@@ -210,17 +262,66 @@ def main(argv: list[str] | None = None) -> int:
             stats["metadata_records"] = export_metadata_json(args.journal, args.metadata)
 
     elif args.stage == "caption":
-        from .captioning.captioners import build_captioner
-        from .captioning.run import caption_folder
-
-        captioner = build_captioner(cfg.section("captioning"), device)
-        stats = caption_folder(
-            captioner,
-            args.images,
-            args.output,
-            batch_size=cfg.get("captioning.batch_size", 8),
-            limit=args.limit,
-        )
+        workers = args.workers or cfg.get("captioning.workers", 1)
+        if args.shard is None and workers > 1:
+            from .captioning.shards import launch_shards, merge_shard_journals
+
+            child_args = ["caption", "--config", str(args.config), "--images", args.images, "--output", args.output]
+            for item in args.set:
+                child_args += ["--set", item]
+            if args.limit:
+                child_args += ["--limit", str(args.limit)]
+            exit_codes = launch_shards(child_args, workers)
+            stats = {
+                "shards": workers,
+                "failed_shards": sum(1 for code in exit_codes if code),
+                "merged": merge_shard_journals(args.output, workers),
+            }
+            if stats["failed_shards"]:  # finished shards are merged; re-running resumes the rest
+                print(f"[caption] {stats['failed_shards']}/{workers} shards failed")
+                exit_code = 1
+        else:
+            from .captioning.captioners import build_captioner
+            from .captioning.run import caption_folder
+            from .captioning.shards import parse_shard, shard_journal
+
+            shard = parse_shard(args.shard) if args.shard else None
+            captioner = build_captioner(cfg.section("captioning"), device)
+            stats = caption_folder(
+                captioner,
+                args.images,
+                shard_journal(args.output, *shard) if shard else args.output,
+                batch_size=cfg.get("captioning.batch_size", 8),
+                limit=args.limit,
+                prefetch=cfg.get("captioning.prefetch_batches", 2),
+                decode_workers=cfg.get("captioning.decode_workers", 4),
+                downscale=cfg.get("captioning.downscale_images", True),
+                adaptive_batching=cfg.get("captioning.adaptive_batching", False),
+                max_batch_size=cfg.get("captioning.max_batch_size", 64),
+                batch_state=Path(cfg.get("run.output_root", "outputs")) / "caption_batch_sizes.json",
+                cache_path=cfg.get("captioning.cache"),
+                shard=shard,
+                runner=cfg.get("captioning.runner", "batch"),
+                slots=cfg.get("captioning.slots", 16),
+                near_duplicate_bits=cfg.get("captioning.near_duplicate_bits"),
+            )
+
+    elif args.stage == "caption-export":
+        from .captioning.captioners import build_captioner, load_image
+        from .captioning.export import check_parity, export_blip
+        from .captioning.sources import iter_images, read_bytes
+
+        model_name = args.model
+        stats["export"] = str(export_blip(model_name, args.output, quantize=args.quantize))
+        if args.check:
+            items, _ = iter_images(args.check)
+            images = [load_image(io.BytesIO(read_bytes(item))) for item in islice(items, args.limit or 32)]
+            # compare against the float32 eager model, whatever quantization captioning.* asks for
+            section = {**cfg.section("captioning"), "model": model_name, "backend": "blip"}
+            section.update(quantization="none", dtype="float32")
+            eager = build_captioner(section, "cpu")
+            exported = build_captioner({**section, "model": args.output, "backend": "blip-torchscript"}, "cpu")
+            stats["parity"] = check_parity(eager, exported, [image for image in images if image is not None])
 
     elif args.stage == "merge":
         from .captioning.merge import merge_captions
@@ -230,29 +331,180 @@ def main(argv: list[str] | None = None) -> int:
     elif args.stage == "fuse":
         from .fusion.fusers import build_fuser
         from .fusion.run import collect_descriptions, fuse_entities
+        from .fusion.store import DescriptionStore
 
         merged = collect_descriptions(
             args.inputs,
             priority_index=cfg.get("fusion.priority_index", 0),
             max_per_entity=cfg.get("fusion.max_descriptions_per_entity", 500),
+            store_path=Path(args.journal).with_suffix(".entities.sqlite") if cfg.get("fusion.out_of_core") else None,
+        )
+        selection = None
+        if cfg.get("fusion.select_model"):
+            from .fusion.select import select_captions
+
+            # CPU keeps the GPU free for the fusion model
+            selection = select_captions(
+                merged,
+                model_name=cfg.get("fusion.select_model"),
+                max_captions=cfg.get("fusion.select_max_captions", 48),
+                min_distance=cfg.get("fusion.select_min_distance", 0.08),
+            )
+        server = args.server or cfg.get("fusion.server")
+        if server:
+            from .fusion.server import RemoteFuser
+
+            fuser = RemoteFuser(server)
+        else:
+            fuser = build_fuser(cfg.section("fusion"), device)
+        cache = None
+        if cfg.get("fusion.cache"):
+            from .fusion.cache import FusionCache
+
+            cache = FusionCache(
+                cfg.get("fusion.cache"),
+                max_entries=cfg.get("fusion.cache_max_entries"),
+                max_age_days=cfg.get("fusion.cache_max_age_days"),
+            )
+        stats = fuse_entities(
+            fuser,
+            merged,
+            args.journal,
+            args.output,
+            limit=args.limit,
+            batch_size=cfg.get("fusion.batch_size", 1),
+            # a server applies its own hierarchical settings
+            chunk_tokens=None if server else _chunk_tokens(cfg),
+            fan_in=cfg.get("fusion.fan_in", 8),
+            cache=cache,
+            metrics_jsonl=Path(args.journal).with_suffix(".metrics.jsonl"),
+        )
+        if cache is not None:
+            cache.close()
+        if isinstance(merged, DescriptionStore):
+            merged.close()
+        if selection:
+            stats["selection"] = selection
+
+    elif args.stage == "fuse-serve":
+        from .fusion.fusers import build_fuser
+        from .fusion.server import serve
+
+        serve(
+            build_fuser(cfg.section("fusion"), device),
+            host=args.host,
+            port=args.port,
+            batch_size=cfg.get("fusion.batch_size", 1),
+            max_wait=cfg.get("fusion.server_max_wait", 0.05),
+            chunk_tokens=_chunk_tokens(cfg),
+            fan_in=cfg.get("fusion.fan_in", 8),
+        )
+
+    elif args.stage == "fuse-sweep":
+        from .fusion.sweep import launch_sweep, prepare_descriptions, run_sweep, write_report
+
+        models = cfg.get("fusion.sweep") or []
+        if args.only:
+            models = [entry for entry in models if entry["name"] == args.only]
+        if not models:
+            raise SystemExit("fuse-sweep: no matching entries in fusion.sweep")
+        select = None
+        if cfg.get("fusion.select_model"):
+            select = {
+                "model_name": cfg.get("fusion.select_model"),
+                "max_captions": cfg.get("fusion.select_max_captions", 48),
+                "min_distance": cfg.get("fusion.select_min_distance", 0.08),
+            }
+        prepared = prepare_descriptions(
+            args.inputs,
+            Path(args.output_dir) / "descriptions.json",
+            priority_index=cfg.get("fusion.priority_index", 0),
+            max_per_entity=cfg.get("fusion.max_descriptions_per_entity", 500),
+            select=select,
         )
-        fuser = build_fuser(cfg.section("fusion"), device)
-        stats = fuse_entities(fuser, merged, args.journal, args.output, limit=args.limit)
+        if args.workers > 1 and not args.only:
+            child_args = ["fuse-sweep", "--config", str(args.config), "--inputs", *args.inputs]
+            child_args += ["--output-dir", args.output_dir]
+            for item in args.set:
+                child_args += ["--set", item]
+            if args.limit:
+                child_args += ["--limit", str(args.limit)]
+            rows = launch_sweep(child_args, [entry["name"] for entry in models], args.workers, args.output_dir)
+        else:
+            rows = run_sweep(models, cfg.section("fusion"), prepared, args.output_dir, device, limit=args.limit)
+        if not args.only:
+            write_report(rows, args.output_dir)
+        stats["models"] = len(rows)
+        stats["failed_models"] = sum(1 for row in rows if row.get("failed"))
+        if stats["failed_models"]:
+            exit_code = 1
 
     elif args.stage == "embed":
-        from .embedding.encode import encode_texts, extract_texts, write_outputs
+        from .embedding.encode import encode_texts, extract_texts, text_hashes, write_outputs
+
+        texts = extract_texts(args.input, text_key=cfg.get("embedding.text_key", "auto"))
+        if args.limit:
+            texts = dict(list(texts.items())[: args.limit])
+        model_name = cfg.get("embedding.model", "bert-base-uncased")
+        outputs = {
+            "h5_path": args.h5,
+            "pth_path": args.pth,
+            "h5_layout": cfg.get("embedding.h5_layout", "per-entity"),
+            "h5_dtype": cfg.get("embedding.h5_dtype", "float32"),
+            "npy_path": args.npy,
+            "npy_dtype": cfg.get("embedding.npy_dtype", "float32"),
+        }
+        if cfg.get("embedding.incremental", False):
+            from .embedding.incremental import embed_incremental
+
+            stats = embed_incremental(
+                texts,
+                model_name,
+                device=device,
+                batch_size=cfg.get("embedding.batch_size", 256),
+                max_batch_tokens=cfg.get("embedding.max_batch_tokens"),
+                workers=cfg.get("embedding.workers", 1),
+                **outputs,
+            )
+        else:
+            entities, embeddings = encode_texts(
+                texts,
+                model_name=model_name,
+                device=device,
+                batch_size=cfg.get("embedding.batch_size", 256),
+                max_batch_tokens=cfg.get("embedding.max_batch_tokens"),
+                workers=cfg.get("embedding.workers", 1),
+            )
+            write_outputs(entities, embeddings, hashes=text_hashes(texts, model_name), **outputs)
+            stats = {"entities": len(entities), "dim": int(embeddings.shape[1])}
+
+    elif args.stage == "embed-bench":
+        from .embedding.batching import benchmark_encode
+        from .embedding.encode import extract_texts
 
         texts = extract_texts(args.input, text_key=cfg.get("embedding.text_key", "auto"))
         if args.limit:
             texts = dict(list(texts.items())[: args.limit])
-        entities, embeddings = encode_texts(
+        stats = benchmark_encode(
             texts,
             model_name=cfg.get("embedding.model", "bert-base-uncased"),
             device=device,
             batch_size=cfg.get("embedding.batch_size", 256),
+            max_batch_tokens=cfg.get("embedding.max_batch_tokens") or (16384 if device.startswith("cuda") else 2048),
+        )
+        for name in ("fixed", "token_budget"):
+            row = stats[name]
+            print(
+                f"[embed-bench] {name:<13} {row['sec']:>8.2f}s {row['texts_per_sec']:>9.1f} texts/s "
+                f"{row['batches']:>5} batches {row['padding']:>6.1%} padding"
+            )
+
+    elif args.stage == "h5-convert":
+        from .embedding.h5 import convert_h5
+
+        stats["entities"] = convert_h5(
+            args.input, args.output, layout=args.layout, dtype=cfg.get("embedding.h5_dtype", "float32")
         )
-        write_outputs(entities, embeddings, h5_path=args.h5, pth_path=args.pth)
-        stats = {"entities": len(entities), "dim": int(embeddings.shape[1])}
 
     elif args.stage == "tokens":
         from .embedding.tokens import tokenize_entities
@@ -285,7 +537,7 @@ def main(argv: list[str] | None = None) -> int:
                 "stats": stats,
             }
         )
-    return 0
+    return exit_code
 
 
 if __name__ == "__main__":
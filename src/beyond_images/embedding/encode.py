@@ -3,23 +3,37 @@
 Replaces original script 5.5. Outputs:
   - .h5  (entity name -> (1, dim) float32 dataset)   e.g. for MMRNS
   - .pth (stacked (N, dim) float32 tensor)           e.g. for AdaMF
-  - .entities.txt manifest listing the row order of the .pth tensor
+  - .npy  (same matrix, memory-mappable; see store.EmbeddingStore)
+  - .entities.txt manifest listing the row order of the .pth tensor / .npy
     (the original relied silently on JSON key order; the manifest makes the
     entity-to-row alignment explicit and checkable).
 
 Improvements: batched GPU encoding (the original encoded one text at a time)
 and a consistent embedding dimension taken from the model, not hardcoded.
+`max_batch_tokens` batches by padded tokens instead of rows (`batching.py`);
+`workers` spreads CPU encoding over pinned processes (`pool.py`).
+`h5_layout="packed"` writes one `(N, dim)` dataset instead of one dataset
+per entity (see `h5.py`; `EmbeddingH5` reads both layouts). `npy_path`
+writes a memory-mappable `.npy` + name index for `EmbeddingStore`.
+
+Given `hashes` (see `text_hashes`), every output also gets a
+`<file>.hashes.json` sidecar (entity -> digest of model name + text, in row
+order) so `incremental.embed_incremental` can re-encode only what changed.
 """
 
 from __future__ import annotations
 
+import hashlib
 from pathlib import Path
 
-import h5py
 import numpy as np
 import torch
 
-from ..utils.jsonl import load_json
+from ..utils.jsonl import load_json, save_json_atomic
+from .batching import encode_budgeted
+from .h5 import PACKED, PER_ENTITY, write_packed_h5, write_per_entity_h5
+from .pool import encode_pool
+from .store import manifest_path, write_npy_store
 
 TEXT_KEYS = ("images_t5_descriptions", "merged_descriptions")
 
@@ -40,16 +54,40 @@ def extract_texts(entity_json: str | Path, text_key: str = "auto") -> dict[str,
     return texts
 
 
+def text_hashes(texts: dict[str, str], model_name: str) -> dict[str, str]:
+    """Per-entity digest of `(model_name, text)`; a model change invalidates every row."""
+    prefix = f"{model_name}\0".encode("utf-8")
+    return {name: hashlib.sha256(prefix + text.encode("utf-8")).hexdigest()[:16] for name, text in texts.items()}
+
+
+def hashes_path(output_path: str | Path) -> Path:
+    output_path = Path(output_path)
+    return output_path.with_suffix(output_path.suffix + ".hashes.json")
+
+
 def encode_texts(
     texts: dict[str, str],
     model_name: str = "bert-base-uncased",
     device: str = "cuda",
     batch_size: int = 256,
+    max_batch_tokens: int | None = None,
+    workers: int = 1,
 ) -> tuple[list[str], np.ndarray]:
+    """Embed `texts` in insertion order.
+
+    `max_batch_tokens` switches to token-budget batches; `workers > 1` on CPU
+    encodes in a pool of pinned processes (`pool.py`).
+    """
+    entities = list(texts.keys())
+    if workers > 1 and device == "cpu" and len(entities) > 1:
+        values = [texts[name] for name in entities]
+        return entities, encode_pool(values, model_name, workers, batch_size, max_batch_tokens)
+
     from sentence_transformers import SentenceTransformer
 
     model = SentenceTransformer(model_name, device=device)
-    entities = list(texts.keys())
+    if max_batch_tokens:
+        return entities, encode_budgeted(model, [texts[name] for name in entities], max_batch_tokens)
     embeddings = model.encode(
         [texts[name] for name in entities],
         batch_size=batch_size,
@@ -64,14 +102,20 @@ def write_outputs(
     embeddings: np.ndarray,
     h5_path: str | Path | None = None,
     pth_path: str | Path | None = None,
+    h5_layout: str = PER_ENTITY,
+    h5_dtype: str = "float32",
+    npy_path: str | Path | None = None,
+    npy_dtype: str = "float32",
+    hashes: dict[str, str] | None = None,
 ) -> None:
     if h5_path:
-        h5_path = Path(h5_path)
-        h5_path.parent.mkdir(parents=True, exist_ok=True)
-        with h5py.File(h5_path, "w") as h5:
-            for name, vector in zip(entities, embeddings):
-                h5.create_dataset(name, data=vector[None, :])
-        print(f"[embed] wrote {h5_path} ({len(entities)} entities, dim={embeddings.shape[1]})")
+        if h5_layout == PACKED:
+            write_packed_h5(h5_path, entities, embeddings, dtype=h5_dtype)
+        elif h5_layout == PER_ENTITY:
+            write_per_entity_h5(h5_path, entities, embeddings)
+        else:
+            raise ValueError(f"Unknown h5 layout {h5_layout!r}; choose {PER_ENTITY} or {PACKED}")
+        print(f"[embed] wrote {h5_path} ({h5_layout}, {len(entities)} entities, dim={embeddings.shape[1]})")
     if pth_path:
         pth_path = Path(pth_path)
         pth_path.parent.mkdir(parents=True, exist_ok=True)
@@ -79,3 +123,11 @@ def write_outputs(
         manifest = pth_path.with_suffix(pth_path.suffix + ".entities.txt")
         manifest.write_text("\n".join(entities) + "\n", encoding="utf-8")
         print(f"[embed] wrote {pth_path} + row manifest {manifest.name}")
+    if npy_path:
+        write_npy_store(npy_path, entities, embeddings, dtype=npy_dtype)
+        print(f"[embed] wrote {npy_path} + row manifest {manifest_path(npy_path).name}")
+    if hashes is not None:
+        ordered = {name: hashes[name] for name in entities}
+        for path in (h5_path, pth_path, npy_path):
+            if path:
+                save_json_atomic(ordered, hashes_path(path), indent=None)
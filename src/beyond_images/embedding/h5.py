@@ -0,0 +1,116 @@
+"""Packed HDF5 embedding layout and a reader for both layouts.
+
+The original layout stores one `(1, dim)` dataset per entity, which MMRNS
+loaders read as `h5[name]`. With 15k-40k entities that is tens of
+thousands of HDF5 objects: slow to write, slow to open, and large on disk.
+
+The packed layout (`layout="packed"` attribute) stores:
+  - `embeddings`: one chunked `(N, dim)` float32/float16 dataset,
+  - `names`:      `(N,)` UTF-8 strings, row i naming `embeddings[i]`.
+
+`EmbeddingH5` reads either layout with the per-entity API consumers already
+use (`reader[name]` -> `(1, dim)` float32 array, `keys()`, `in`, `len`), so
+code written against `h5py.File(path)[name]` only has to swap the open call.
+`convert_h5` rewrites a file in the other layout for consumers that cannot
+change at all.
+"""
+
+from __future__ import annotations
+
+from pathlib import Path
+from typing import Iterator
+
+import h5py
+import numpy as np
+
+PACKED = "packed"
+PER_ENTITY = "per-entity"
+
+
+def write_packed_h5(
+    path: str | Path,
+    entities: list[str],
+    embeddings: np.ndarray,
+    dtype: str = "float32",
+) -> None:
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    data = np.asarray(embeddings, dtype=dtype)
+    rows = max(1, min(len(entities), (64 << 10) // max(1, data.shape[1] * data.itemsize)))  # ~64 KiB chunks
+    with h5py.File(path, "w") as h5:
+        h5.attrs["layout"] = PACKED
+        h5.create_dataset("embeddings", data=data, chunks=(rows, data.shape[1]) if len(entities) else None)
+        h5.create_dataset("names", data=entities, dtype=h5py.string_dtype("utf-8"))
+
+
+def write_per_entity_h5(path: str | Path, entities: list[str], embeddings: np.ndarray) -> None:
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with h5py.File(path, "w") as h5:
+        for name, vector in zip(entities, embeddings):
+            h5.create_dataset(name, data=np.asarray(vector, dtype=np.float32)[None, :])
+
+
+class EmbeddingH5:
+    """Per-entity lookups over a packed or per-entity embedding file."""
+
+    def __init__(self, path: str | Path):
+        self._h5 = h5py.File(path, "r")
+        self.layout = self._h5.attrs.get("layout", PER_ENTITY)
+        if self.layout == PACKED:
+            self._data = self._h5["embeddings"]
+            names = self._h5["names"].asstr()[()]
+            self._rows = {name: row for row, name in enumerate(names)}
+            self._names = list(names)
+
+    def __len__(self) -> int:
+        return len(self._rows) if self.layout == PACKED else len(self._h5)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._rows if self.layout == PACKED else name in self._h5
+
+    def keys(self) -> list[str]:
+        return self._names if self.layout == PACKED else list(self._h5.keys())
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.keys())
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        if self.layout == PACKED:
+            row = self._rows[name]
+            return self._data[row : row + 1].astype(np.float32)
+        return self._h5[name][()].astype(np.float32)
+
+    def get_many(self, names: list[str]) -> np.ndarray:
+        """`(len(names), dim)` float32 rows in the order given."""
+        if self.layout != PACKED:
+            return np.concatenate([self[name] for name in names]) if names else np.zeros((0, 0), np.float32)
+        rows = np.array([self._rows[name] for name in names], dtype=np.int64)
+        unique, inverse = np.unique(rows, return_inverse=True)  # h5py fancy indexing needs increasing rows
+        return self._data[unique].astype(np.float32)[inverse]
+
+    def load_all(self) -> tuple[list[str], np.ndarray]:
+        names = self.keys()
+        if self.layout == PACKED:
+            return names, self._data[()].astype(np.float32)
+        return names, self.get_many(names)
+
+    def close(self) -> None:
+        self._h5.close()
+
+    def __enter__(self) -> "EmbeddingH5":
+        return self
+
+    def __exit__(self, *exc: object) -> None:
+        self.close()
+
+
+def convert_h5(src: str | Path, dst: str | Path, layout: str = PER_ENTITY, dtype: str = "float32") -> int:
+    """Rewrite `src` into `dst` with the given layout; returns the number of entities."""
+    with EmbeddingH5(src) as reader:
+        names, embeddings = reader.load_all()
+    if layout == PACKED:
+        write_packed_h5(dst, names, embeddings, dtype=dtype)
+    else:
+        write_per_entity_h5(dst, names, embeddings)
+    return len(names)
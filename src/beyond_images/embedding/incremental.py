@@ -0,0 +1,165 @@
+"""Incremental re-embedding: encode only the entities whose text changed.
+
+After a curation pass in the checker app only a handful of fused summaries
+differ, yet `embed` used to re-encode every entity. `embed_incremental`
+compares `text_hashes` of the current texts with the `<file>.hashes.json`
+sidecar that `write_outputs` leaves next to each output, then:
+
+  - encodes only new and changed entities (the model is not even loaded when
+    nothing changed),
+  - keeps the previous row order: surviving entities stay in their rows, new
+    ones are appended, removed ones are dropped,
+  - patches outputs in place while their rows do not move: changed rows of a
+    `.npy` or packed `.h5` are overwritten, per-entity `.h5` datasets are
+    overwritten, created or deleted. Outputs whose rows moved (entities added
+    or removed), `.pth` tensors, and outputs with a missing or disagreeing
+    sidecar are rewritten from the merged matrix instead.
+
+Previous vectors come from the first output with a sidecar (`.npy`, then
+`.h5`, then `.pth`). A sidecar is deleted before its output is patched and
+written back afterwards, so an interrupted run costs a full re-encode next
+time rather than leaving stale rows marked as current.
+"""
+
+from __future__ import annotations
+
+from pathlib import Path
+
+import h5py
+import numpy as np
+import torch
+
+from ..utils.jsonl import load_json, save_json_atomic
+from .encode import encode_texts, hashes_path, text_hashes, write_outputs
+from .h5 import PACKED, PER_ENTITY, EmbeddingH5
+from .store import EmbeddingStore, manifest_path
+
+
+def _load_rows(kind: str, path: Path, names: list[str]) -> np.ndarray:
+    """`(len(names), dim)` float32 rows of `names` from a previous output."""
+    if kind == "npy":
+        return np.asarray(EmbeddingStore(path).batch(names), dtype=np.float32)
+    if kind == "h5":
+        with EmbeddingH5(path) as reader:
+            return reader.get_many(names)
+    rows = {name: row for row, name in enumerate(manifest_path(path).read_text(encoding="utf-8").splitlines())}
+    return torch.load(path).numpy()[[rows[name] for name in names]].astype(np.float32)
+
+
+def _patch(
+    kind: str,
+    path: Path,
+    old_order: list[str],
+    order: list[str],
+    changed: list[str],
+    matrix: np.ndarray,
+    h5_layout: str,
+    h5_dtype: str,
+    npy_dtype: str,
+) -> bool:
+    """Overwrite the `changed` rows of `path` in place; False if the file has to be rewritten."""
+    rows = {name: row for row, name in enumerate(order)}
+    changed_rows = sorted(rows[name] for name in changed)  # h5py fancy indexing needs increasing rows
+    if kind == "npy":
+        if old_order != order:
+            return False
+        data = np.load(path, mmap_mode="r+")
+        if data.dtype != np.dtype(npy_dtype):
+            return False
+        hashes_path(path).unlink()
+        data[changed_rows] = matrix[changed_rows].astype(data.dtype)
+        data.flush()
+        return True
+    if kind != "h5":  # .pth cannot be patched; torch.save rewrites the whole tensor
+        return old_order == order and not changed
+    with h5py.File(path, "r+") as h5:
+        if h5.attrs.get("layout", PER_ENTITY) != h5_layout:
+            return False
+        if h5_layout == PACKED:
+            data = h5["embeddings"]
+            if old_order != order or data.dtype != np.dtype(h5_dtype):
+                return False
+            hashes_path(path).unlink()
+            if changed_rows:
+                data[changed_rows] = matrix[changed_rows].astype(data.dtype)
+            return True
+        hashes_path(path).unlink()
+        for name in set(old_order) - set(rows):
+            del h5[name]
+        for name in changed:
+            vector = matrix[rows[name]][None, :]
+            if name in h5:
+                h5[name][...] = vector
+            else:
+                h5.create_dataset(name, data=vector)
+    return True
+
+
+def embed_incremental(
+    texts: dict[str, str],
+    model_name: str = "bert-base-uncased",
+    device: str = "cuda",
+    batch_size: int = 256,
+    h5_path: str | Path | None = None,
+    pth_path: str | Path | None = None,
+    h5_layout: str = PER_ENTITY,
+    h5_dtype: str = "float32",
+    npy_path: str | Path | None = None,
+    npy_dtype: str = "float32",
+    max_batch_tokens: int | None = None,
+    workers: int = 1,
+) -> dict:
+    """Bring the given outputs up to date with `texts`; returns counts of encoded/reused/removed rows."""
+    hashes = text_hashes(texts, model_name)
+    outputs = [(kind, Path(path)) for kind, path in (("npy", npy_path), ("h5", h5_path), ("pth", pth_path)) if path]
+    previous = {
+        kind: load_json(hashes_path(path))
+        for kind, path in outputs
+        if path.exists() and hashes_path(path).exists()
+    }
+    writer_kwargs = {"h5_layout": h5_layout, "h5_dtype": h5_dtype, "npy_dtype": npy_dtype, "hashes": hashes}
+    if not previous:
+        entities, embeddings = encode_texts(texts, model_name, device, batch_size, max_batch_tokens, workers)
+        write_outputs(entities, embeddings, h5_path=h5_path, pth_path=pth_path, npy_path=npy_path, **writer_kwargs)
+        return {"entities": len(entities), "dim": int(embeddings.shape[1]), "encoded": len(entities), "reused": 0}
+
+    source = next(kind for kind, _ in outputs if kind in previous)
+    prev = previous[source]
+    order = [name for name in prev if name in hashes] + [name for name in hashes if name not in prev]
+    reused = [name for name in order if prev.get(name) == hashes[name]]
+    changed = [name for name in order if prev.get(name) != hashes[name]]
+    print(f"[embed] incremental: {len(changed)} to encode, {len(reused)} unchanged (from {source})")
+
+    parts = []
+    if reused:
+        parts.append((reused, _load_rows(source, dict(outputs)[source], reused)))
+    if changed:
+        changed_texts = {name: texts[name] for name in changed}
+        parts.append(encode_texts(changed_texts, model_name, device, batch_size, max_batch_tokens, workers))
+    dim = int(parts[0][1].shape[1]) if parts else 0
+    matrix = np.empty((len(order), dim), dtype=np.float32)
+    rows = {name: row for row, name in enumerate(order)}
+    for names, vectors in parts:
+        matrix[[rows[name] for name in names]] = vectors
+
+    patched, rewritten = [], []
+    for kind, path in outputs:
+        old = previous.get(kind)
+        in_sync = old is not None and list(old.items()) == list(prev.items())  # same rows, same order
+        if in_sync and _patch(kind, path, list(old), order, changed, matrix, h5_layout, h5_dtype, npy_dtype):
+            save_json_atomic({name: hashes[name] for name in order}, hashes_path(path), indent=None)
+            patched.append(kind)
+        else:
+            write_outputs(order, matrix, **{f"{kind}_path": path}, **writer_kwargs)
+            rewritten.append(kind)
+    if patched:
+        print(f"[embed] patched {', '.join(patched)} in place ({len(changed)} rows)")
+    return {
+        "entities": len(order),
+        "dim": dim,
+        "encoded": len(changed),
+        "reused": len(reused),
+        "removed": sum(name not in hashes for name in prev),
+        "patched": patched,
+        "rewritten": rewritten,
+    }
@@ -0,0 +1,135 @@
+"""Multi-process CPU embedding pool.
+
+A single SentenceTransformer process relies on PyTorch intra-op threads
+alone. Those stop scaling well before 64 cores: per-layer matmuls on one
+batch are too small to split that many ways, and tokenization runs on one
+thread. `encode_pool` runs `workers` independent processes instead. Each is
+pinned to its own contiguous slice of cores (`captioning.shards.cpu_slice`,
+the same slicing as caption shards) with a matching thread count, so e.g. 8
+workers x 8 threads keep a 64-core host busy on separate batches.
+
+  - Texts are dealt out longest-first, round-robin, so every worker gets a
+    similar mix of lengths and the workers finish together.
+  - Each worker loads the model and reports its embedding size. It then
+    writes its rows, at their original indices, straight into one `(N, dim)`
+    float32 `SharedMemory` block created by the parent. Only texts and row
+    indices are pickled, never embedding arrays.
+  - The parent copies the block out once every worker is done.
+
+Workers are started with `spawn`: forking a process whose torch thread pools
+are already initialised can deadlock.
+"""
+
+from __future__ import annotations
+
+import multiprocessing as mp
+import os
+import traceback
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+
+from ..captioning.shards import cpu_slice
+from .batching import encode_budgeted
+
+
+def _worker(
+    conn,
+    cpus: set[int] | None,
+    threads: int,
+    model_name: str,
+    texts: list[str],
+    rows: list[int],
+    batch_size: int,
+    max_batch_tokens: int | None,
+) -> None:
+    try:
+        if cpus:
+            os.sched_setaffinity(0, cpus)
+        import torch
+        from sentence_transformers import SentenceTransformer
+
+        torch.set_num_threads(threads)
+        model = SentenceTransformer(model_name, device="cpu")
+        conn.send(("ready", int(model.encode(["."], convert_to_numpy=True).shape[1])))
+        name, total, dim = conn.recv()
+        if max_batch_tokens:
+            vectors = encode_budgeted(model, texts, max_batch_tokens)
+        else:
+            vectors = model.encode(texts, batch_size=batch_size, convert_to_numpy=True, show_progress_bar=False)
+        shm = SharedMemory(name=name)
+        output = np.ndarray((total, dim), dtype=np.float32, buffer=shm.buf)
+        output[rows] = vectors
+        del output  # release the buffer export before close()
+        shm.close()
+        conn.send(("done", len(rows)))
+    except Exception:
+        conn.send(("error", traceback.format_exc()))
+
+
+def _receive(conn, proc, expected: str):
+    try:
+        kind, value = conn.recv()
+    except EOFError:
+        proc.join()
+        raise RuntimeError(f"embedding worker {proc.name} exited with code {proc.exitcode}") from None
+    if kind == "error":
+        raise RuntimeError(f"embedding worker {proc.name} failed:\n{value}")
+    if kind != expected:
+        raise RuntimeError(f"embedding worker {proc.name}: expected {expected!r}, got {kind!r}")
+    return value
+
+
+def encode_pool(
+    texts: list[str],
+    model_name: str,
+    workers: int,
+    batch_size: int = 256,
+    max_batch_tokens: int | None = None,
+) -> np.ndarray:
+    """`(len(texts), dim)` float32 embeddings in input order, encoded by `workers` CPU processes."""
+    workers = max(1, min(workers, len(texts)))
+    by_length = sorted(range(len(texts)), key=lambda i: -len(texts[i]))
+    shards = [by_length[index::workers] for index in range(workers)]
+    ctx = mp.get_context("spawn")
+    procs, conns = [], []
+    shm = None
+    try:
+        for index, rows in enumerate(shards):
+            threads, cpus = cpu_slice(index, workers)
+            parent_conn, child_conn = ctx.Pipe()
+            shard = [texts[i] for i in rows]
+            proc = ctx.Process(
+                target=_worker,
+                args=(child_conn, cpus, threads, model_name, shard, rows, batch_size, max_batch_tokens),
+                name=f"embed-{index}",
+                daemon=True,
+            )
+            proc.start()
+            child_conn.close()  # so a dead worker shows up as EOFError on recv
+            procs.append(proc)
+            conns.append(parent_conn)
+        print(f"[embed] {len(texts)} texts over {workers} CPU workers x {cpu_slice(0, workers)[0]} threads")
+
+        dims = {_receive(conn, proc, "ready") for conn, proc in zip(conns, procs)}
+        if len(dims) != 1:
+            raise RuntimeError(f"embedding workers disagree on the embedding size: {sorted(dims)}")
+        dim = dims.pop()
+        shm = SharedMemory(create=True, size=max(1, len(texts) * dim * 4))
+        for conn in conns:
+            conn.send((shm.name, len(texts), dim))
+        for conn, proc in zip(conns, procs):
+            _receive(conn, proc, "done")
+
+        output = np.ndarray((len(texts), dim), dtype=np.float32, buffer=shm.buf)
+        embeddings = output.copy()
+        del output
+        return embeddings
+    finally:
+        for proc in procs:
+            proc.join(timeout=10)
+            if proc.is_alive():
+                proc.terminate()
+        if shm is not None:
+            shm.close()
+            shm.unlink()
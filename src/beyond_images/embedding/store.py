@@ -0,0 +1,72 @@
+"""Memory-mapped embedding store: `.npy` matrix plus a sidecar name index.
+
+The `.pth` output has to be `torch.load`ed whole into every process's RAM.
+The store is a plain `.npy` file (header with dtype and shape, then the
+C-ordered `(N, dim)` matrix) plus `<file>.entities.txt` naming one row per
+line, like the `.pth` row manifest. `EmbeddingStore` maps the file
+read-only, so every training process on a host shares the same page-cached
+copy:
+
+  - `store[name]` and `store.slice(start, stop)` return views (no copy),
+  - `store.batch(names)` gathers arbitrary rows into one new array,
+  - `store.tensor()` wraps the whole mapping as a CPU tensor without copying.
+"""
+
+from __future__ import annotations
+
+from pathlib import Path
+
+import numpy as np
+
+
+def manifest_path(npy_path: str | Path) -> Path:
+    npy_path = Path(npy_path)
+    return npy_path.with_suffix(npy_path.suffix + ".entities.txt")
+
+
+def write_npy_store(npy_path: str | Path, entities: list[str], embeddings: np.ndarray, dtype: str = "float32") -> None:
+    npy_path = Path(npy_path)
+    npy_path.parent.mkdir(parents=True, exist_ok=True)
+    np.save(npy_path, np.ascontiguousarray(embeddings, dtype=dtype))
+    manifest_path(npy_path).write_text("\n".join(entities) + "\n", encoding="utf-8")
+
+
+class EmbeddingStore:
+    """Read-only, memory-mapped `(N, dim)` embeddings addressed by entity name."""
+
+    def __init__(self, npy_path: str | Path):
+        self.path = Path(npy_path)
+        self.matrix = np.load(self.path, mmap_mode="r")
+        self.names = manifest_path(self.path).read_text(encoding="utf-8").splitlines()
+        if len(self.names) != self.matrix.shape[0]:
+            raise ValueError(f"{self.path}: {self.matrix.shape[0]} rows but {len(self.names)} names in the manifest")
+        self._rows = {name: row for row, name in enumerate(self.names)}
+
+    @property
+    def dim(self) -> int:
+        return self.matrix.shape[1]
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._rows
+
+    def row(self, name: str) -> int:
+        return self._rows[name]
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        """`(dim,)` read-only view of one entity's row."""
+        return self.matrix[self._rows[name]]
+
+    def slice(self, start: int, stop: int) -> np.ndarray:
+        return self.matrix[start:stop]
+
+    def batch(self, names: list[str]) -> np.ndarray:
+        """`(len(names), dim)` copy of the named rows, in order."""
+        return self.matrix[[self._rows[name] for name in names]]
+
+    def tensor(self):
+        import torch
+
+        return torch.from_numpy(self.matrix)  # shares the mapping; treat as read-only
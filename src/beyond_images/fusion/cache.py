@@ -0,0 +1,106 @@
+"""Content-addressed fusion cache shared across KGs and runs.
+
+The fusion journal is keyed by entity name, so an entity shared by MKG-W
+and MKG-Y is fused twice, and an entity whose captions changed would reuse
+its stale paragraph. Here every fused paragraph is keyed by a digest of
+everything that determines it:
+
+  - backend, model, decoding settings and token limits,
+  - the prompt template (rendered with placeholders),
+  - hierarchical chunking settings,
+  - the entity name and its normalised description list.
+
+The cache is an append-only JSONL file like the caption cache. Entries
+older than `max_age_days` are dropped and only the newest `max_entries`
+are kept; the file is compacted on open when anything was evicted.
+Sampled (non-deterministic) runs are never cached.
+
+Several fusion runs (sweep slots, the fusion server) may share one cache
+file. Reading plus compaction, and every append, happen under an exclusive
+`flock` on `<cache>.lock`. A writer whose file was replaced by another
+process's compaction reopens it before appending, so no entry lands in an
+unlinked file.
+"""
+
+from __future__ import annotations
+
+import fcntl
+import hashlib
+import json
+import os
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+from ..utils.jsonl import JsonlWriter, read_jsonl
+from .fusers import Fuser
+
+
+def fusion_namespace(fuser: Fuser, **settings) -> str:
+    """Digest of the fuser configuration and prompt template (plus any extra `settings`)."""
+    payload = [*fuser.signature(), settings]
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+
+def input_digest(namespace: str, entity_name: str, descriptions: list[str]) -> str:
+    normalized = [" ".join(desc.split()) for desc in descriptions]
+    payload = json.dumps([entity_name, normalized], ensure_ascii=False).encode("utf-8")
+    return f"{namespace}:{hashlib.sha256(payload).hexdigest()}"
+
+
+class FusionCache:
+    """`input_digest -> fused paragraph` lookups with size/age eviction."""
+
+    def __init__(self, path: str | Path, max_entries: int | None = None, max_age_days: float | None = None):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock_fh = open(self.path.with_suffix(self.path.suffix + ".lock"), "a")
+        with self._locked():
+            records = list(read_jsonl(self.path))
+            kept = records
+            if max_age_days:
+                cutoff = time.time() - max_age_days * 86400
+                kept = [rec for rec in kept if rec.get("time", 0) >= cutoff]
+            if max_entries and len(kept) > max_entries:
+                kept = sorted(kept, key=lambda rec: rec.get("time", 0))[-max_entries:]
+            if len(kept) < len(records):
+                self._compact(kept)
+                print(f"[fuse-cache] evicted {len(records) - len(kept)} entries")
+            self._writer = JsonlWriter(self.path)
+        self._entries = {rec["key"]: rec["text"] for rec in kept}
+
+    @contextmanager
+    def _locked(self):
+        fcntl.flock(self._lock_fh, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(self._lock_fh, fcntl.LOCK_UN)
+
+    def _compact(self, records: list[dict]) -> None:
+        tmp = self.path.with_suffix(self.path.suffix + ".compact")
+        tmp.unlink(missing_ok=True)
+        with JsonlWriter(tmp) as writer:
+            for rec in records:
+                writer.write(rec)
+        tmp.replace(self.path)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str) -> str | None:
+        return self._entries.get(key)
+
+    def put(self, key: str, text: str) -> None:
+        if key in self._entries:
+            return
+        self._entries[key] = text
+        with self._locked():
+            if not self.path.exists() or os.stat(self.path).st_ino != os.fstat(self._writer.fileno()).st_ino:
+                self._writer.close()  # compacted by another process since we opened it
+                self._writer = JsonlWriter(self.path)
+            self._writer.write({"key": key, "text": text, "time": round(time.time())})
+
+    def close(self) -> None:
+        self._writer.close()
+        self._lock_fh.close()
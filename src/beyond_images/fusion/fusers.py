@@ -8,10 +8,33 @@ Two model families, selected via `fusion.backend`:
 Decoding is configurable. The original Mistral/Llama scripts sampled with
 temperature 0.6 (non-reproducible); `deterministic: true` switches to greedy /
 beam decoding so identical inputs always yield identical summaries.
+
+Both backends generate for several entities at once via `fuse_batch`
+(padded batch; causal models pad on the left). `fuse` is the batch-of-one case.
+
+`fusion.draft_model` (causal only) enables assisted (speculative) decoding:
+a small model from the same family drafts tokens that the main model
+verifies in one forward pass. Greedy output is unchanged because every
+token is still the main model's argmax. Assisted generation handles one
+sequence at a time, so batches are decoded entity by entity; a draft
+model with a different tokenizer falls back to universal assisted
+decoding. Beam search cannot be combined with a draft model.
+
+Prompts respect `fusion.max_input_tokens` by packing whole descriptions
+(`Fuser.pack`): each description is tokenised once (batched, cached) and
+descriptions are kept in priority order while they fit, so the budget is
+never spent on half a caption. Seq2seq models still truncate as a last
+resort; causal models have no budget unless one is configured.
+
+Every generate call is instrumented: input/output tokens per entity,
+prefill time (until the first logits) vs decode time, decode steps and
+peak memory. `drain_metrics` hands the per-entity rows to the caller.
 """
 
 from __future__ import annotations
 
+import time
+
 import torch
 
 PAPER_PROMPT = (
@@ -43,18 +66,139 @@ def _quantization_kwargs(quantization: str, dtype: str) -> dict:
     return {"dtype": getattr(torch, dtype), "device_map": "auto"}
 
 
+class _StepTimer:
+    """Logits processor that only timestamps decode steps (first call = end of prefill)."""
+
+    def __init__(self):
+        self.first: float | None = None
+        self.steps = 0
+
+    def __call__(self, input_ids: torch.Tensor, scores: torch.Tensor) -> torch.Tensor:
+        if self.first is None:
+            if scores.device.type == "cuda":
+                torch.cuda.synchronize(scores.device)
+            self.first = time.perf_counter()
+        self.steps += 1
+        return scores
+
+
+def _peak_memory_mb(device: torch.device) -> float:
+    if device.type == "cuda":
+        return torch.cuda.max_memory_allocated(device) / 2**20
+    import resource
+
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # process peak RSS (KiB on Linux)
+
+
 class Fuser:
+    max_input_tokens: int | None = None
+
     def __init__(self, cfg: dict, device: str):
         self.cfg = cfg
         self.device = device
         self.max_new_tokens = cfg.get("max_new_tokens", 384)
         self.deterministic = cfg.get("deterministic", True)
+        self._token_counts: dict[str, int] = {}
+        self._metrics: list[dict] = []
         self._load()
 
     def _load(self) -> None:
         raise NotImplementedError
 
     def fuse(self, entity_name: str, descriptions: list[str]) -> str:
+        return self.fuse_batch([(entity_name, descriptions)])[0]
+
+    def fuse_batch(self, entities: list[tuple[str, list[str]]]) -> list[str]:
+        """Fuse `[(entity_name, descriptions), ...]` in one padded generate call."""
+        raise NotImplementedError
+
+    def pack(self, entity_name: str, descriptions: list[str]) -> tuple[list[str], int]:
+        """Whole descriptions that fit `max_input_tokens`, and the number of tokens left out."""
+        free = self.input_budget(entity_name)
+        if free is None or not descriptions:
+            return descriptions, 0
+        lengths = self.token_lengths(descriptions)
+        kept, dropped = [], 0
+        for desc, length in zip(descriptions, lengths):
+            if length + 1 <= free:  # +1 for the separating newline
+                kept.append(desc)
+                free -= length + 1
+            else:
+                dropped += length
+        if not kept:  # a single oversized caption is truncated rather than lost
+            kept, dropped = descriptions[:1], dropped - lengths[0]
+        return kept, dropped
+
+    def input_budget(self, entity_name: str) -> int | None:
+        """Description tokens (each +1 for its separator) that fit `max_input_tokens` beside the prompt."""
+        if not self.max_input_tokens:
+            return None
+        return self.max_input_tokens - len(self.tokenizer(self._prompt(entity_name, []))["input_ids"])
+
+    def share_token_counts(self, counts: dict[str, int]) -> None:
+        """Memoise `token_lengths` in `counts`, e.g. one dict shared by fusers with the same tokenizer."""
+        self._token_counts = counts
+
+    def token_lengths(self, descriptions: list[str]) -> list[int]:
+        """Token count of each description (no special tokens), memoised per text."""
+        missing = [desc for desc in dict.fromkeys(descriptions) if desc not in self._token_counts]
+        if missing:
+            if len(self._token_counts) > 500_000:
+                self._token_counts.clear()
+            encoded = self.tokenizer(missing, add_special_tokens=False)["input_ids"]
+            self._token_counts.update((desc, len(ids)) for desc, ids in zip(missing, encoded))
+        return [self._token_counts[desc] for desc in descriptions]
+
+    def drain_metrics(self) -> list[dict]:
+        """Per-entity rows recorded by generate calls since the last drain."""
+        metrics, self._metrics = self._metrics, []
+        return metrics
+
+    def _timed_generate(self, entities: list, inputs, response_start: int, **kwargs) -> torch.Tensor:
+        """`model.generate` plus metrics; returns the generated tokens from `response_start` on."""
+        from transformers import LogitsProcessorList
+
+        device = self.model.device
+        if device.type == "cuda":
+            torch.cuda.reset_peak_memory_stats(device)
+        timer = _StepTimer()
+        started = time.perf_counter()
+        with torch.inference_mode():
+            outputs = self.model.generate(**inputs, logits_processor=LogitsProcessorList([timer]), **kwargs)
+        if device.type == "cuda":
+            torch.cuda.synchronize(device)
+        finished = time.perf_counter()
+        first = timer.first or finished
+
+        responses = outputs[:, response_start:]
+        input_tokens = inputs["attention_mask"].sum(-1).tolist()
+        output_tokens = (responses != self.tokenizer.pad_token_id).sum(-1).tolist()
+        peak = round(_peak_memory_mb(device), 1)
+        rows = len(entities)
+        for (name, _), n_in, n_out in zip(entities, input_tokens, output_tokens):
+            self._metrics.append(
+                {
+                    "entity_name": name,
+                    "input_tokens": n_in,
+                    "output_tokens": n_out,
+                    # this entity's share of the batch's wall time
+                    "prefill_sec": (first - started) / rows,
+                    "decode_sec": (finished - first) / rows,
+                    "decode_steps": timer.steps,
+                    "batch_size": rows,
+                    "peak_mem_mb": peak,
+                    "truncated": bool(self.max_input_tokens) and n_in >= self.max_input_tokens,
+                }
+            )
+        return responses
+
+    def signature(self) -> list:
+        """Everything besides the inputs that determines a fused paragraph (for cache keys)."""
+        cfg = {key: self.cfg.get(key) for key in ("backend", "model", "quantization", "dtype", "max_input_tokens")}
+        template = self._prompt("{entity_name}", ["{descriptions}"])
+        return [type(self).__name__, cfg, self.max_new_tokens, self._decoding_kwargs(), template]
+
+    def _prompt(self, entity_name: str, descriptions: list[str]) -> str:
         raise NotImplementedError
 
     def _decoding_kwargs(self) -> dict:
@@ -82,27 +226,31 @@ class Seq2SeqFuser(Fuser):
         self.model.eval()
         self.max_input_tokens = self.cfg.get("max_input_tokens", 1024)
 
-    def fuse(self, entity_name: str, descriptions: list[str]) -> str:
-        prompt = (
+    def _prompt(self, entity_name: str, descriptions: list[str]) -> str:
+        return (
             PAPER_PROMPT.format(entity_name=entity_name)
             + "\n\nList of descriptions to summarize:\n"
             + "\n".join(descriptions)
             + "\n\nDetailed Summary Paragraph:"
         )
+
+    def fuse_batch(self, entities: list[tuple[str, list[str]]]) -> list[str]:
         inputs = self.tokenizer(
-            prompt,
+            [self._prompt(name, self.pack(name, descriptions)[0]) for name, descriptions in entities],
             return_tensors="pt",
+            padding=True,
             truncation=True,
             max_length=self.max_input_tokens,
         ).to(self.model.device)
-        with torch.inference_mode():
-            outputs = self.model.generate(
-                **inputs,
-                max_new_tokens=self.max_new_tokens,
-                early_stopping=self.cfg.get("num_beams", 1) > 1,
-                **self._decoding_kwargs(),
-            )
-        return self.tokenizer.decode(outputs[0], skip_special_tokens=True).strip()
+        outputs = self._timed_generate(
+            entities,
+            inputs,
+            0,
+            max_new_tokens=self.max_new_tokens,
+            early_stopping=self.cfg.get("num_beams", 1) > 1,
+            **self._decoding_kwargs(),
+        )
+        return [text.strip() for text in self.tokenizer.batch_decode(outputs, skip_special_tokens=True)]
 
 
 class CausalFuser(Fuser):
@@ -113,11 +261,24 @@ class CausalFuser(Fuser):
         self.tokenizer = AutoTokenizer.from_pretrained(model_name)
         if self.tokenizer.pad_token is None:
             self.tokenizer.pad_token = self.tokenizer.eos_token
+        self.tokenizer.padding_side = "left"
         kwargs = _quantization_kwargs(self.cfg.get("quantization", "none"), self.cfg.get("dtype", "bfloat16"))
         self.model = AutoModelForCausalLM.from_pretrained(model_name, **kwargs)
         self.model.eval()
+        self.max_input_tokens = self.cfg.get("max_input_tokens")
 
-    def fuse(self, entity_name: str, descriptions: list[str]) -> str:
+        self._assist: dict = {}
+        draft_name = self.cfg.get("draft_model")
+        if draft_name:
+            if self.deterministic and self.cfg.get("num_beams", 1) > 1:
+                raise ValueError("fusion.draft_model requires num_beams: 1 (assisted decoding is greedy or sampled)")
+            draft = AutoModelForCausalLM.from_pretrained(draft_name, **kwargs).eval()
+            self._assist["assistant_model"] = draft
+            if draft.config.get_text_config().vocab_size != self.model.config.get_text_config().vocab_size:
+                self._assist["tokenizer"] = self.tokenizer
+                self._assist["assistant_tokenizer"] = AutoTokenizer.from_pretrained(draft_name)
+
+    def _prompt(self, entity_name: str, descriptions: list[str]) -> str:
         messages = [
             {"role": "system", "content": CHAT_SYSTEM_PROMPT},
             {
@@ -128,24 +289,32 @@ class CausalFuser(Fuser):
                 ),
             },
         ]
-        prompt = self.tokenizer.apply_chat_template(
-            messages, tokenize=False, add_generation_prompt=True
-        )
-        inputs = self.tokenizer(prompt, return_tensors="pt").to(self.model.device)
+        return self.tokenizer.apply_chat_template(messages, tokenize=False, add_generation_prompt=True)
+
+    def fuse_batch(self, entities: list[tuple[str, list[str]]]) -> list[str]:
+        prompts = [self._prompt(name, self.pack(name, descriptions)[0]) for name, descriptions in entities]
+        if self._assist:
+            return [self._generate([entry], [prompt])[0] for entry, prompt in zip(entities, prompts)]
+        return self._generate(entities, prompts)
+
+    def _generate(self, entities: list[tuple[str, list[str]]], prompts: list[str]) -> list[str]:
+        # left padding keeps every prompt's last token adjacent to its first generated token
+        inputs = self.tokenizer(prompts, return_tensors="pt", padding=True).to(self.model.device)
         eos_ids = [self.tokenizer.eos_token_id]
         eot = self.tokenizer.convert_tokens_to_ids("<|eot_id|>")
         if isinstance(eot, int) and eot >= 0 and eot != self.tokenizer.unk_token_id:
             eos_ids.append(eot)
-        with torch.inference_mode():
-            outputs = self.model.generate(
-                **inputs,
-                max_new_tokens=self.max_new_tokens,
-                eos_token_id=eos_ids,
-                pad_token_id=self.tokenizer.eos_token_id,
-                **self._decoding_kwargs(),
-            )
-        response = outputs[0][inputs["input_ids"].shape[-1] :]
-        return self.tokenizer.decode(response, skip_special_tokens=True).strip()
+        responses = self._timed_generate(
+            entities,
+            inputs,
+            inputs["input_ids"].shape[-1],
+            max_new_tokens=self.max_new_tokens,
+            eos_token_id=eos_ids,
+            pad_token_id=self.tokenizer.pad_token_id,
+            **self._decoding_kwargs(),
+            **self._assist,
+        )
+        return [text.strip() for text in self.tokenizer.batch_decode(responses, skip_special_tokens=True)]
 
 
 def build_fuser(cfg: dict, device: str) -> Fuser:
@@ -0,0 +1,101 @@
+"""Hierarchical (map-reduce) fusion for entities with many captions.
+
+A single prompt cannot hold hundreds of captions: `Seq2SeqFuser` truncates
+at `max_input_tokens` (silently dropping most of them) and `CausalFuser`
+pays quadratic attention on one huge prompt. Here each entity's captions
+are packed greedily into chunks of at most `chunk_tokens` tokens (capped at
+`Fuser.input_budget`, with the same per-caption separator `Fuser.pack`
+charges, so a chunk is never packed down again), every chunk is fused on
+its own (map), and the partial summaries are fused again
+in groups of at most `fan_in` (reduce) until one paragraph remains. Each
+level batches the chunks of all entities together through `fuse_batch`.
+An entity that fits in one chunk is fused exactly as before. Whatever
+`Fuser.pack` still has to leave out (a reduce pair of partial summaries
+over the budget) is reported through `dropped`.
+"""
+
+from __future__ import annotations
+
+from .fusers import Fuser
+
+
+def pack_chunks(
+    descriptions: list[str],
+    lengths: list[int],
+    chunk_tokens: int,
+    fan_in: int | None = None,
+    min_items: int = 1,
+) -> list[list[str]]:
+    """Greedily pack whole descriptions into chunks of <= `chunk_tokens` (and <= `fan_in` items).
+
+    Each description costs its length plus one separator token, as in `Fuser.pack`.
+
+    A chunk is only closed once it holds `min_items`, so reduce levels always
+    shrink the number of partial summaries.
+    """
+    chunks: list[list[str]] = []
+    current: list[str] = []
+    used = 0
+    for desc, length in zip(descriptions, lengths):
+        over = used + length + 1 > chunk_tokens or (fan_in and len(current) >= fan_in)
+        full = len(current) >= min_items and over
+        if full:
+            chunks.append(current)
+            current, used = [], 0
+        current.append(desc)
+        used += length + 1
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def fuse_hierarchical(
+    fuser: Fuser,
+    entities: list[tuple[str, list[str]]],
+    chunk_tokens: int,
+    fan_in: int = 8,
+    batch_size: int = 8,
+    dropped: dict[str, int] | None = None,
+) -> list[str]:
+    """Map-reduce `fuser.fuse_batch` over `[(entity_name, descriptions), ...]`.
+
+    If given, `dropped` receives the tokens `Fuser.pack` left out per entity name.
+    """
+    pending = {idx: descriptions for idx, (_, descriptions) in enumerate(entities)}
+    budgets = {}
+    for idx, (name, _) in enumerate(entities):
+        budget = fuser.input_budget(name)
+        budgets[idx] = chunk_tokens if budget is None else max(1, min(chunk_tokens, budget))
+    left_out = dict.fromkeys((name for name, _ in entities), 0)
+    results: dict[int, str] = {}
+    level = 0
+    while pending:
+        jobs: list[tuple[int, list[str]]] = []
+        for idx, descriptions in pending.items():
+            lengths = fuser.token_lengths(descriptions)
+            if level == 0:
+                chunks = pack_chunks(descriptions, lengths, budgets[idx])
+            else:
+                chunks = pack_chunks(descriptions, lengths, budgets[idx], max(2, fan_in), min_items=2)
+            for chunk in chunks:
+                kept, lost = fuser.pack(entities[idx][0], chunk)
+                left_out[entities[idx][0]] += lost
+                jobs.append((idx, kept))
+
+        partials: dict[int, list[str]] = {idx: [] for idx in pending}
+        for start in range(0, len(jobs), batch_size):
+            batch = jobs[start : start + batch_size]
+            fused = fuser.fuse_batch([(entities[idx][0], chunk) for idx, chunk in batch])
+            for (idx, _), text in zip(batch, fused):
+                partials[idx].append(text)
+
+        pending = {}
+        for idx, texts in partials.items():
+            if len(texts) == 1:
+                results[idx] = texts[0]
+            else:
+                pending[idx] = texts
+        level += 1
+    if dropped is not None:
+        dropped.update(left_out)
+    return [results[idx] for idx in range(len(entities))]
@@ -4,16 +4,23 @@ Input: one or more entity summary JSON files produced by the captioning
 merge step (typically the original-image and new-image files).
 Output: the same entity schema with
 `images.images_t5_descriptions` holding the fused paragraph, plus a JSONL
-journal so interrupted runs resume where they stopped.
+journal so interrupted runs resume where they stopped. Journal records
+carry an `input_digest`; a record whose inputs (captions, model, prompt)
+have changed since is fused again instead of being reused.
 """
 
 from __future__ import annotations
 
+import heapq
 import time
+from itertools import islice
 from pathlib import Path
 
-from ..utils.jsonl import JsonlWriter, load_json, read_jsonl, save_json_atomic
+from ..utils.jsonl import JsonlWriter, JsonObjectWriter, iter_json_object, read_jsonl
+from .cache import FusionCache, fusion_namespace, input_digest
 from .fusers import Fuser
+from .hierarchical import fuse_hierarchical
+from .store import DescriptionStore
 
 FUSED_KEY = "images_t5_descriptions"  # kept for compatibility with released data
 
@@ -37,82 +44,199 @@ def collect_descriptions(
     input_files: list[str | Path],
     priority_index: int = 0,
     max_per_entity: int = 500,
-) -> dict[str, dict]:
+    store_path: str | Path | None = None,
+) -> dict[str, dict] | DescriptionStore:
     """Merge entity records from `input_files`, capping descriptions per entity.
 
     Descriptions from `input_files[priority_index]` fill the cap first
-    (by default the original-image captions take priority).
+    (by default the original-image captions take priority). Inputs are
+    parsed one entity at a time; with `store_path` the merged records are
+    kept in an on-disk `DescriptionStore` instead of a dict.
     """
-    merged: dict[str, dict] = {}
+    merged: dict[str, dict] | DescriptionStore = DescriptionStore(store_path) if store_path else {}
     ordered = [input_files[priority_index]] + [
         f for i, f in enumerate(input_files) if i != priority_index
     ]
     for source in ordered:
-        data = load_json(source)
-        for entity_name, record in data.items():
-            slot = merged.setdefault(
-                entity_name,
-                {
-                    **{k: v for k, v in record.items() if k != "images"},
-                    "_descriptions": [],
-                },
-            )
+        for entity_name, record in iter_json_object(source):
+            slot = merged.get(entity_name) or {
+                **{k: v for k, v in record.items() if k != "images"},
+                "_descriptions": [],
+            }
             images = record.get("images")
-            if not isinstance(images, dict):
-                continue
-            captions = [
-                value["image_description_detail"]
-                for value in images.values()
-                if isinstance(value, dict) and value.get("image_description_detail")
-            ]
-            remaining = max_per_entity - len(slot["_descriptions"])
-            if remaining > 0:
-                slot["_descriptions"].extend(clean_descriptions(captions)[:remaining])
+            if isinstance(images, dict):
+                captions = [
+                    value["image_description_detail"]
+                    for value in images.values()
+                    if isinstance(value, dict) and value.get("image_description_detail")
+                ]
+                remaining = max_per_entity - len(slot["_descriptions"])
+                if remaining > 0:
+                    slot["_descriptions"].extend(clean_descriptions(captions)[:remaining])
+            merged[entity_name] = slot
+    return merged
+
+
+def _journal_record(entity_name: str, fused: str, digest: str, tokens_dropped: int | None) -> dict:
+    record = {"entity_name": entity_name, FUSED_KEY: fused, "input_digest": digest}
+    if tokens_dropped:
+        record["tokens_dropped"] = tokens_dropped
+    return record
+
+
+def _entity_metrics(rows: list[dict]) -> dict[str, dict]:
+    """Sum generate-call metrics per entity (hierarchical fusion makes several calls)."""
+    merged: dict[str, dict] = {}
+    for row in rows:
+        slot = merged.setdefault(
+            row["entity_name"],
+            {"input_tokens": 0, "output_tokens": 0, "prefill_sec": 0.0, "decode_sec": 0.0, "generate_calls": 0},
+        )
+        for key in ("input_tokens", "output_tokens", "prefill_sec", "decode_sec"):
+            slot[key] += row[key]
+        slot["generate_calls"] += 1
+        slot["batch_size"] = row["batch_size"]
+        slot["peak_mem_mb"] = max(slot.get("peak_mem_mb", 0.0), row["peak_mem_mb"])
+        slot["truncated"] = slot.get("truncated", False) or row["truncated"]
     return merged
 
 
 def fuse_entities(
     fuser: Fuser,
-    merged: dict[str, dict],
+    merged: dict[str, dict] | DescriptionStore,
     journal_jsonl: str | Path,
     output_json: str | Path,
     limit: int | None = None,
+    batch_size: int = 1,
+    chunk_tokens: int | None = None,
+    fan_in: int = 8,
+    cache: FusionCache | None = None,
+    window: int = 4096,
+    metrics_jsonl: str | Path | None = None,
 ) -> dict[str, int]:
-    items = list(merged.items())
-    if limit:
-        items = items[:limit]
+    """Fuse every entity not yet in the journal, `batch_size` entities per generate call.
 
-    done = {rec["entity_name"]: rec[FUSED_KEY] for rec in read_jsonl(journal_jsonl)}
-    todo = [(name, rec) for name, rec in items if name not in done]
-    print(f"[fuse] {len(items)} entities, {len(done)} done, {len(todo)} to fuse")
+    Entities are read `window` at a time and the output is written
+    incrementally, so memory is bounded by the window rather than the KG.
+    Within a window entities are processed longest-first so similar prompt
+    lengths share a batch (less padding) and out-of-memory errors surface
+    early. A failing batch is retried one entity at a time so one bad
+    entity only loses itself. With `chunk_tokens`, entities are fused
+    hierarchically (see `hierarchical.fuse_hierarchical`) so captions are
+    spread over chunks instead of truncated away. Entities found in `cache`
+    are written without running the model. Otherwise descriptions are
+    packed to the fuser's token budget first (`Fuser.pack`). Either way,
+    journal records note `tokens_dropped` where packing bit.
 
-    stats = {"entities": len(items), "fused": 0, "empty": 0, "errors": 0}
+    With `metrics_jsonl`, one row per fused entity records input/output
+    tokens, prefill vs decode seconds (its share of the batch), peak memory
+    and truncation; the returned stats sum them and name the slowest
+    entities.
+    """
+
+    def fuse_batch(batch: list[tuple[str, list[str]]], dropped: dict[str, int]) -> list[str]:
+        if chunk_tokens:
+            return fuse_hierarchical(fuser, batch, chunk_tokens, fan_in, batch_size, dropped=dropped)
+        return fuser.fuse_batch(batch)
+
+    if cache is not None and not fuser.deterministic:
+        cache = None  # sampled outputs are not reproducible, so never cached
+    namespace = fusion_namespace(fuser, chunk_tokens=chunk_tokens, fan_in=fan_in if chunk_tokens else None)
+    journal = {rec["entity_name"]: (rec.get("input_digest"), rec[FUSED_KEY]) for rec in read_jsonl(journal_jsonl)}
+    total = min(len(merged), limit) if limit else len(merged)
+    print(f"[fuse] {total} entities, {len(journal)} in journal")
+
+    stats = {"entities": total, "resumed": 0, "fused": 0, "cached": 0, "empty": 0, "errors": 0}
+    stats.update(tokens_dropped=0, truncated_entities=0)
+    totals = {"input_tokens": 0, "output_tokens": 0, "prefill_sec": 0.0, "decode_sec": 0.0, "peak_mem_mb": 0.0}
+    slowest: list[tuple[float, str]] = []
+    metrics_writer = JsonlWriter(metrics_jsonl) if metrics_jsonl else None
+    fuser.drain_metrics()
     started = time.time()
-    with JsonlWriter(journal_jsonl) as writer:
-        for idx, (entity_name, record) in enumerate(todo, 1):
-            descriptions = record["_descriptions"]
-            if not descriptions:
-                stats["empty"] += 1
-                continue
-            try:
-                fused = fuser.fuse(entity_name, descriptions)
-            except Exception as exc:  # keep the queue moving; log and continue
-                stats["errors"] += 1
-                print(f"[fuse] error on {entity_name!r}: {exc}")
-                continue
-            writer.write({"entity_name": entity_name, FUSED_KEY: fused})
-            done[entity_name] = fused
-            stats["fused"] += 1
-            if idx % 10 == 0:
-                rate = stats["fused"] / max(time.time() - started, 1e-6)
-                print(f"[fuse] {idx}/{len(todo)} ({rate:.2f} ent/s)")
-
-    final = {}
-    for entity_name, record in items:
-        output_record = {k: v for k, v in record.items() if not k.startswith("_")}
-        output_record["images"] = {}
-        if entity_name in done:
-            output_record["images"][FUSED_KEY] = done[entity_name]
-        final[entity_name] = output_record
-    save_json_atomic(final, output_json)
+    with JsonlWriter(journal_jsonl) as writer, JsonObjectWriter(output_json) as output:
+        entries = iter(islice(merged.items(), limit) if limit else merged.items())
+        for items in iter(lambda: list(islice(entries, window)), []):
+            digests = {name: input_digest(namespace, name, rec["_descriptions"]) for name, rec in items}
+            done = {}
+            for name, _ in items:
+                prior = journal.get(name)
+                if prior and prior[0] in (None, digests[name]):  # legacy records carry no digest
+                    done[name] = prior[1]
+            stats["resumed"] += len(done)
+            work = [(name, rec["_descriptions"]) for name, rec in items if name not in done and rec["_descriptions"]]
+            stats["empty"] += len(items) - len(done) - len(work)
+
+            dropped: dict[str, int] = {}
+            if not chunk_tokens:  # hierarchical fusion packs each chunk itself and reports into `dropped`
+                packed = []
+                for entity_name, descriptions in work:
+                    kept, dropped[entity_name] = fuser.pack(entity_name, descriptions)
+                    packed.append((entity_name, kept))
+                work = packed
+            work.sort(key=lambda entry: sum(len(desc) for desc in entry[1]), reverse=True)
+
+            if cache is not None:
+                misses = []
+                for entity_name, descriptions in work:
+                    fused = cache.get(digests[entity_name])
+                    if fused is None:
+                        misses.append((entity_name, descriptions))
+                        continue
+                    writer.write(_journal_record(entity_name, fused, digests[entity_name], dropped.get(entity_name)))
+                    done[entity_name] = fused
+                    stats["cached"] += 1
+                work = misses
+            for start in range(0, len(work), batch_size):
+                batch = work[start : start + batch_size]
+                try:
+                    results = list(zip(batch, fuse_batch(batch, dropped)))
+                except Exception as exc:
+                    if len(batch) > 1:
+                        print(f"[fuse] batch failed ({exc}); retrying entities one by one")
+                    results = []
+                    for entry in batch:
+                        try:
+                            results.append((entry, fuse_batch([entry], dropped)[0]))
+                        except Exception as exc:  # keep the queue moving; log and continue
+                            stats["errors"] += 1
+                            print(f"[fuse] error on {entry[0]!r}: {exc}")
+                metrics = _entity_metrics(fuser.drain_metrics())
+                for (entity_name, _), fused in results:
+                    writer.write(_journal_record(entity_name, fused, digests[entity_name], dropped.get(entity_name)))
+                    done[entity_name] = fused
+                    if cache is not None:
+                        cache.put(digests[entity_name], fused)
+                    stats["fused"] += 1
+                    row = metrics.get(entity_name)
+                    if row:
+                        for key in ("input_tokens", "output_tokens", "prefill_sec", "decode_sec"):
+                            totals[key] += row[key]
+                        totals["peak_mem_mb"] = max(totals["peak_mem_mb"], row["peak_mem_mb"])
+                        heapq.heappush(slowest, (row["prefill_sec"] + row["decode_sec"], entity_name))
+                        if len(slowest) > 5:
+                            heapq.heappop(slowest)
+                        if metrics_writer:
+                            metrics_writer.write(
+                                {
+                                    "entity_name": entity_name,
+                                    **{k: round(v, 4) if isinstance(v, float) else v for k, v in row.items()},
+                                    "tokens_dropped": dropped.get(entity_name, 0),
+                                }
+                            )
+                if stats["fused"] // 10 > (stats["fused"] - len(results)) // 10:
+                    rate = stats["fused"] / max(time.time() - started, 1e-6)
+                    print(f"[fuse] {stats['fused']} fused, {stats['cached']} cached ({rate:.2f} ent/s)")
+
+            stats["tokens_dropped"] += sum(dropped.values())
+            stats["truncated_entities"] += sum(1 for count in dropped.values() if count)
+            for entity_name, record in items:
+                output_record = {k: v for k, v in record.items() if not k.startswith("_")}
+                output_record["images"] = {}
+                if entity_name in done:
+                    output_record["images"][FUSED_KEY] = done[entity_name]
+                output.write(entity_name, output_record)
+    if metrics_writer:
+        metrics_writer.close()
+    stats.update({key: round(value, 2) for key, value in totals.items()})
+    stats["slowest"] = [[name, round(sec, 2)] for sec, name in sorted(slowest, reverse=True)]
     return stats
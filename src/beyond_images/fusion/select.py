@@ -0,0 +1,99 @@
+"""Semantic caption selection before fusion.
+
+`clean_descriptions` only removes exact duplicates, so the many
+near-identical BLIP captions of an entity ("a man in a suit standing in
+front of a building") all reach the fusion prompt. `select_captions`
+embeds every caption with a small sentence encoder (batched, on CPU) and
+keeps a diverse subset per entity with farthest-point (k-centers)
+selection:
+
+  - start from the most central caption (highest mean similarity),
+  - repeatedly add the caption least similar to everything already kept,
+  - stop at `max_captions`, or once every remaining caption is within
+    `min_distance` (cosine distance) of a kept one, i.e. only
+    near-duplicates are left.
+
+Kept captions stay in their original order, so the priority source
+(original-image captions) still comes first in the prompt.
+"""
+
+from __future__ import annotations
+
+import numpy as np
+
+from .store import DescriptionStore
+
+
+def select_diverse(vectors: np.ndarray, max_captions: int, min_distance: float = 0.0) -> list[int]:
+    """Indices (ascending) of a k-centers subset of L2-normalised `vectors`."""
+    if len(vectors) == 0:
+        return []
+    similarity = vectors @ vectors.T
+    chosen = [int(similarity.mean(axis=1).argmax())]
+    nearest = similarity[chosen[0]].copy()  # similarity to the closest kept caption
+    nearest[chosen[0]] = np.inf
+    while len(chosen) < min(max_captions, len(vectors)):
+        candidate = int(nearest.argmin())
+        if 1.0 - nearest[candidate] <= min_distance:
+            break
+        chosen.append(candidate)
+        np.maximum(nearest, similarity[candidate], out=nearest)
+        nearest[candidate] = np.inf
+    return sorted(chosen)
+
+
+def select_captions(
+    merged: dict[str, dict] | DescriptionStore,
+    model_name: str = "sentence-transformers/all-MiniLM-L6-v2",
+    max_captions: int = 48,
+    min_distance: float = 0.08,
+    device: str = "cpu",
+    batch_size: int = 256,
+    group_captions: int = 8192,
+) -> dict[str, int]:
+    """Shrink every entity's `_descriptions` (written back to `merged`); returns caption counts.
+
+    Captions are encoded for groups of entities at a time (about
+    `group_captions` captions per group), which keeps memory bounded on
+    large KGs while every encoder call still sees full batches.
+    """
+    from sentence_transformers import SentenceTransformer
+
+    model = SentenceTransformer(model_name, device=device)
+    stats = {"captions_in": 0, "captions_out": 0}
+
+    def flush(group: list[tuple[str, dict]]) -> None:
+        texts = [desc for _, record in group for desc in record["_descriptions"]]
+        vectors = model.encode(
+            texts,
+            batch_size=batch_size,
+            convert_to_numpy=True,
+            normalize_embeddings=True,
+            show_progress_bar=False,
+        ).astype(np.float32)
+        offset = 0
+        for name, record in group:
+            descriptions = record["_descriptions"]
+            block = vectors[offset : offset + len(descriptions)]
+            offset += len(descriptions)
+            record["_descriptions"] = [descriptions[i] for i in select_diverse(block, max_captions, min_distance)]
+            stats["captions_out"] += len(record["_descriptions"])
+            merged[name] = record
+
+    group: list[tuple[str, dict]] = []
+    pending = 0
+    for name, record in merged.items():
+        count = len(record["_descriptions"])
+        stats["captions_in"] += count
+        if count <= 1:
+            stats["captions_out"] += count
+            continue
+        group.append((name, record))
+        pending += count
+        if pending >= group_captions:
+            flush(group)
+            group, pending = [], 0
+    if group:
+        flush(group)
+    print(f"[select] kept {stats['captions_out']}/{stats['captions_in']} captions")
+    return stats
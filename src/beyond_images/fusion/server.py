@@ -0,0 +1,189 @@
+"""Long-lived fusion server and its client.
+
+Loading a 7B fuser takes minutes, and every `fuse` run used to pay it.
+`serve` keeps one fuser resident behind a small HTTP API on localhost:
+
+  GET  /info  -> {"signature": ..., "deterministic": ..., "batch_size": ...}
+  POST /fuse  {"entities": [[name, [description, ...]], ...]}
+              -> {"texts": [...], "errors": [...]}
+
+Requests from any number of clients (several `fuse` runs, the checker app)
+go into one queue of per-entity jobs. A single worker thread builds each
+generate batch from whatever jobs are waiting, up to `batch_size`, waiting
+at most `max_wait` seconds for a batch to fill, so concurrent runs share
+batches instead of taking turns. Batching is per request entity, not per
+decode step: `model.generate` cannot admit new rows mid-generation.
+Hierarchical fusion, when configured, runs server-side.
+
+`RemoteFuser` is a `Fuser` that forwards `fuse_batch` to a server, so
+`fuse_entities` (journal, cache, retries) works unchanged in client mode.
+"""
+
+from __future__ import annotations
+
+import json
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from .fusers import Fuser
+from .hierarchical import fuse_hierarchical
+
+
+class BatchingWorker:
+    """Single thread that turns queued `(entity, Future)` jobs into `fuse_batch` calls."""
+
+    def __init__(
+        self,
+        fuser: Fuser,
+        batch_size: int = 8,
+        max_wait: float = 0.05,
+        chunk_tokens: int | None = None,
+        fan_in: int = 8,
+    ):
+        self.fuser = fuser
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self.chunk_tokens = chunk_tokens
+        self.fan_in = fan_in
+        self._jobs: queue.Queue[tuple[tuple[str, list[str]], Future]] = queue.Queue()
+        threading.Thread(target=self._run, name="fusion-worker", daemon=True).start()
+
+    def submit(self, entities: list[tuple[str, list[str]]]) -> list[Future]:
+        futures = []
+        for entry in entities:
+            future: Future = Future()
+            self._jobs.put((entry, future))
+            futures.append(future)
+        return futures
+
+    def _fuse(self, entities: list[tuple[str, list[str]]]) -> list[str]:
+        if self.chunk_tokens:
+            dropped: dict[str, int] = {}
+            texts = fuse_hierarchical(self.fuser, entities, self.chunk_tokens, self.fan_in, self.batch_size, dropped)
+            for name, count in dropped.items():
+                if count:
+                    print(f"[fuse-serve] {name!r}: {count} tokens over the input budget were left out")
+            return texts
+        return self.fuser.fuse_batch(entities)
+
+    def _run(self) -> None:
+        while True:
+            jobs = [self._jobs.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(jobs) < self.batch_size:
+                try:
+                    jobs.append(self._jobs.get(timeout=max(0.0, deadline - time.monotonic())))
+                except queue.Empty:
+                    break
+            try:
+                for (_, future), text in zip(jobs, self._fuse([entry for entry, _ in jobs])):
+                    future.set_result(text)
+            except Exception:
+                for entry, future in jobs:  # isolate the failing entity
+                    try:
+                        future.set_result(self._fuse([entry])[0])
+                    except Exception as exc:
+                        future.set_exception(exc)
+            self.fuser.drain_metrics()  # not reported to clients; drop them so memory stays bounded
+
+
+def serve(
+    fuser: Fuser,
+    host: str = "127.0.0.1",
+    port: int = 8765,
+    batch_size: int = 8,
+    max_wait: float = 0.05,
+    chunk_tokens: int | None = None,
+    fan_in: int = 8,
+) -> None:
+    """Serve `fuser` until interrupted."""
+    worker = BatchingWorker(fuser, batch_size, max_wait, chunk_tokens, fan_in)
+    info = {
+        "signature": [*fuser.signature(), {"chunk_tokens": chunk_tokens, "fan_in": fan_in if chunk_tokens else None}],
+        "deterministic": fuser.deterministic,
+        "batch_size": batch_size,
+    }
+
+    class Handler(BaseHTTPRequestHandler):
+        def _reply(self, code: int, payload: dict) -> None:
+            body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self) -> None:
+            if self.path == "/info":
+                self._reply(200, info)
+            else:
+                self._reply(404, {"error": "unknown endpoint"})
+
+        def do_POST(self) -> None:
+            if self.path != "/fuse":
+                self._reply(404, {"error": "unknown endpoint"})
+                return
+            try:
+                request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+                entities = [(str(name), list(descriptions)) for name, descriptions in request["entities"]]
+            except (ValueError, KeyError, TypeError) as exc:
+                self._reply(400, {"error": f"bad request: {exc}"})
+                return
+            texts, errors = [], []
+            for future in worker.submit(entities):
+                try:
+                    texts.append(future.result())
+                    errors.append(None)
+                except Exception as exc:
+                    texts.append(None)
+                    errors.append(str(exc))
+            self._reply(200, {"texts": texts, "errors": errors})
+
+        def log_message(self, format: str, *args) -> None:
+            pass  # one line per request would drown the progress output
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    print(f"[fuse-serve] listening on http://{host}:{port} (batch_size={batch_size})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+class RemoteFuser(Fuser):
+    """Client for a running `serve` process."""
+
+    def __init__(self, url: str, timeout: float = 3600):
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+        super().__init__({"backend": "remote", "url": self.url}, device="remote")
+
+    def _load(self) -> None:
+        import requests
+
+        self._session = requests.Session()
+        info = self._session.get(f"{self.url}/info", timeout=30).json()
+        self.deterministic = info["deterministic"]
+        self.batch_size = info["batch_size"]
+        self._signature = info["signature"]
+
+    def signature(self) -> list:
+        return self._signature
+
+    def fuse_batch(self, entities: list[tuple[str, list[str]]]) -> list[str]:
+        response = self._session.post(
+            f"{self.url}/fuse",
+            json={"entities": [[name, descriptions] for name, descriptions in entities]},
+            timeout=self.timeout,
+        )
+        response.raise_for_status()
+        reply = response.json()
+        failed = [(name, error) for (name, _), error in zip(entities, reply["errors"]) if error]
+        if failed:
+            raise RuntimeError(f"server failed on {len(failed)} entities, e.g. {failed[0][0]!r}: {failed[0][1]}")
+        return reply["texts"]
@@ -0,0 +1,73 @@
+"""On-disk entity index for out-of-core fusion.
+
+`collect_descriptions` used to hold every entity of every input file, plus
+its description list, in one dict. `DescriptionStore` offers the same
+mapping interface backed by a scratch SQLite file, so merging inputs,
+caption selection and fusion all touch one entity (or one page of entities)
+at a time. Iteration follows first-insertion order, like a dict. The file is
+rebuilt on every run and needs no durability, so journalling and fsync are
+off.
+"""
+
+from __future__ import annotations
+
+import json
+import sqlite3
+from pathlib import Path
+from typing import Iterator
+
+
+class DescriptionStore:
+    """`entity_name -> merged record` mapping stored in SQLite."""
+
+    def __init__(self, path: str | Path, page_size: int = 1000):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.path.unlink(missing_ok=True)
+        self.page_size = page_size
+        self._db = sqlite3.connect(self.path)
+        self._db.execute("PRAGMA journal_mode = OFF")
+        self._db.execute("PRAGMA synchronous = OFF")
+        self._db.execute(
+            "CREATE TABLE entities (id INTEGER PRIMARY KEY, name TEXT UNIQUE NOT NULL, record TEXT NOT NULL)"
+        )
+
+    def __len__(self) -> int:
+        return self._db.execute("SELECT COUNT(*) FROM entities").fetchone()[0]
+
+    def get(self, name: str, default: dict | None = None) -> dict | None:
+        row = self._db.execute("SELECT record FROM entities WHERE name = ?", (name,)).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def __getitem__(self, name: str) -> dict:
+        record = self.get(name)
+        if record is None:
+            raise KeyError(name)
+        return record
+
+    def __setitem__(self, name: str, record: dict) -> None:
+        self._db.execute(
+            "INSERT INTO entities (name, record) VALUES (?, ?) "
+            "ON CONFLICT (name) DO UPDATE SET record = excluded.record",
+            (name, json.dumps(record, ensure_ascii=False)),
+        )
+
+    def items(self) -> Iterator[tuple[str, dict]]:
+        # keyset pagination: no cursor stays open, so callers may write back while iterating
+        last = 0
+        while True:
+            rows = self._db.execute(
+                "SELECT id, name, record FROM entities WHERE id > ? ORDER BY id LIMIT ?", (last, self.page_size)
+            ).fetchall()
+            if not rows:
+                return
+            for _, name, record in rows:
+                yield name, json.loads(record)
+            last = rows[-1][0]
+
+    def values(self) -> Iterator[dict]:
+        return (record for _, record in self.items())
+
+    def close(self) -> None:
+        self._db.close()
+        self.path.unlink(missing_ok=True)
@@ -0,0 +1,195 @@
+"""Multi-model fusion sweep over one shared set of prepared descriptions.
+
+Paper-style comparisons fuse the same entities with several models. Running
+`fuse` once per model repeats `collect_descriptions`, cleaning and caption
+selection every time. `fuse-sweep` instead:
+
+  1. prepares the description sets once into `<output_dir>/descriptions.json`
+     (reused while the inputs and preparation settings are unchanged; see
+     the `.manifest.json` next to it),
+  2. fuses them with every entry of `fusion.sweep`, where each entry is a
+     `name` plus overrides of the `fusion.*` keys, writing
+     `<output_dir>/<name>/fuse.jsonl` and `fused.json`,
+  3. writes `<output_dir>/sweep_report.json` comparing load time and
+     entities per second.
+
+Models run one after another on one device, or `--workers N` at a time in
+separate processes pinned like caption shards. In-process runs share
+description token counts between models whose tokenizers have the same
+vocabulary (e.g. Flan-T5 base and large).
+"""
+
+from __future__ import annotations
+
+import gc
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+from ..captioning.shards import worker_env
+from ..utils.jsonl import JsonObjectWriter, iter_json_object, load_json, save_json_atomic
+from .cache import FusionCache
+from .fusers import build_fuser
+from .run import collect_descriptions, fuse_entities
+from .store import DescriptionStore
+
+REPORT_NAME = "sweep_report.json"
+
+
+def prepare_descriptions(
+    input_files: list[str | Path],
+    prepared_json: str | Path,
+    priority_index: int = 0,
+    max_per_entity: int = 500,
+    select: dict | None = None,
+) -> Path:
+    """Collect (and optionally select) descriptions once; reuse the file while inputs are unchanged."""
+    prepared_json = Path(prepared_json)
+    manifest_path = prepared_json.with_suffix(".manifest.json")
+    manifest = {
+        "inputs": [[str(f), Path(f).stat().st_size, Path(f).stat().st_mtime_ns] for f in input_files],
+        "priority_index": priority_index,
+        "max_per_entity": max_per_entity,
+        "select": select,
+    }
+    if prepared_json.exists() and manifest_path.exists() and load_json(manifest_path) == manifest:
+        print(f"[sweep] reusing prepared descriptions {prepared_json}")
+        return prepared_json
+
+    store = prepared_json.with_suffix(".sqlite")
+    merged = collect_descriptions(input_files, priority_index, max_per_entity, store_path=store)
+    if select:
+        from .select import select_captions
+
+        select_captions(merged, **select)
+    with JsonObjectWriter(prepared_json) as output:
+        for entity_name, record in merged.items():
+            output.write(entity_name, record)
+    merged.close()
+    save_json_atomic(manifest, manifest_path)
+    print(f"[sweep] prepared descriptions -> {prepared_json}")
+    return prepared_json
+
+
+def load_prepared(prepared_json: str | Path, store_path: str | Path | None = None) -> dict | DescriptionStore:
+    merged: dict | DescriptionStore = DescriptionStore(store_path) if store_path else {}
+    for entity_name, record in iter_json_object(prepared_json):
+        merged[entity_name] = record
+    return merged
+
+
+def tokenizer_fingerprint(tokenizer) -> str:
+    vocab = sorted(tokenizer.get_vocab().items())
+    return hashlib.sha256(json.dumps([type(tokenizer).__name__, vocab]).encode("utf-8")).hexdigest()[:16]
+
+
+def run_sweep(
+    models: list[dict],
+    fusion_cfg: dict,
+    prepared_json: str | Path,
+    output_dir: str | Path,
+    device: str,
+    limit: int | None = None,
+) -> list[dict]:
+    """Fuse `prepared_json` with every model entry in turn; returns one report row per model."""
+    output_dir = Path(output_dir)
+    token_counts: dict[str, dict[str, int]] = {}
+    rows = []
+    for entry in models:
+        name = entry["name"]
+        cfg = {**fusion_cfg, **{k: v for k, v in entry.items() if k != "name"}}
+        run_dir = output_dir / name
+        print(f"[sweep] {name}: {cfg.get('backend')} {cfg.get('model')}")
+
+        started = time.time()
+        fuser = build_fuser(cfg, device)
+        load_sec = time.time() - started
+        fuser.share_token_counts(token_counts.setdefault(tokenizer_fingerprint(fuser.tokenizer), {}))
+
+        merged = load_prepared(prepared_json, run_dir / "entities.sqlite" if cfg.get("out_of_core") else None)
+        cache = None
+        if cfg.get("cache"):
+            cache = FusionCache(cfg["cache"], cfg.get("cache_max_entries"), cfg.get("cache_max_age_days"))
+        started = time.time()
+        stats = fuse_entities(
+            fuser,
+            merged,
+            run_dir / "fuse.jsonl",
+            run_dir / "fused.json",
+            limit=limit,
+            batch_size=cfg.get("batch_size", 1),
+            chunk_tokens=cfg.get("chunk_tokens") if cfg.get("hierarchical", False) else None,
+            fan_in=cfg.get("fan_in", 8),
+            cache=cache,
+            metrics_jsonl=run_dir / "fuse.metrics.jsonl",
+        )
+        fuse_sec = time.time() - started
+        if cache is not None:
+            cache.close()
+        if isinstance(merged, DescriptionStore):
+            merged.close()
+
+        row = {
+            "name": name,
+            "backend": cfg.get("backend"),
+            "model": cfg.get("model"),
+            "load_sec": round(load_sec, 2),
+            "fuse_sec": round(fuse_sec, 2),
+            "entities_per_sec": round(stats["fused"] / max(fuse_sec, 1e-6), 3),
+            **stats,
+        }
+        save_json_atomic(row, run_dir / "sweep_stats.json")
+        rows.append(row)
+
+        del fuser
+        gc.collect()
+        try:
+            import torch
+
+            if torch.cuda.is_available():
+                torch.cuda.empty_cache()
+        except ImportError:
+            pass
+    return rows
+
+
+def launch_sweep(child_args: list[str], names: list[str], workers: int, output_dir: str | Path) -> list[dict]:
+    """Run `python -m beyond_images <child_args> --only <name>` for every model, `workers` at a time."""
+    running: dict[int, subprocess.Popen] = {}  # device slot -> run
+    for name in names:
+        while len(running) >= workers:  # the first run to finish, in any slot, frees it
+            for slot in [slot for slot, proc in running.items() if proc.poll() is not None]:
+                del running[slot]
+            if len(running) >= workers:
+                time.sleep(0.5)
+        slot = min(set(range(workers)) - running.keys())
+        env, cpus = worker_env(slot, workers)
+        pin = (lambda cpus=cpus: os.sched_setaffinity(0, cpus)) if cpus else None
+        (Path(output_dir) / name / "sweep_stats.json").unlink(missing_ok=True)  # no stale rows for failed runs
+        print(f"[sweep] launching {name}")
+        cmd = [sys.executable, "-m", "beyond_images", *child_args, "--only", name]
+        running[slot] = subprocess.Popen(cmd, env=env, preexec_fn=pin)
+    for proc in running.values():
+        proc.wait()
+    rows = []
+    for name in names:
+        stats_path = Path(output_dir) / name / "sweep_stats.json"
+        rows.append(load_json(stats_path) if stats_path.exists() else {"name": name, "failed": True})
+    return rows
+
+
+def write_report(rows: list[dict], output_dir: str | Path) -> None:
+    save_json_atomic(rows, Path(output_dir) / REPORT_NAME)
+    print(f"[sweep] {'model':<24} {'load s':>8} {'fuse s':>8} {'ent/s':>8} {'fused':>7}")
+    for row in rows:
+        if row.get("failed"):
+            print(f"[sweep] {row['name']:<24} failed")
+            continue
+        print(
+            f"[sweep] {row['name']:<24} {row['load_sec']:>8.1f} {row['fuse_sec']:>8.1f} "
+            f"{row['entities_per_sec']:>8.2f} {row['fused']:>7}"
+        )
@@ -1,7 +1,13 @@
 """Incremental JSONL persistence with resume support.
 
 Every long-running stage appends one JSON record per completed unit of work,
-so interrupted runs lose nothing and re-runs skip finished units.
+so interrupted runs lose nothing and re-runs skip finished units. A process
+killed mid-write leaves a torn last line: readers skip it with a warning and
+the next writer starts on a fresh line, so the journal stays readable.
+
+Large top-level JSON objects (entity summary files) can also be read and
+written one key at a time (`iter_json_object`, `JsonObjectWriter`) so memory
+does not grow with the number of entities.
 """
 
 from __future__ import annotations
@@ -17,10 +23,14 @@ def read_jsonl(path: str | Path) -> Iterator[dict[str, Any]]:
     if not path.exists():
         return
     with open(path, "r", encoding="utf-8") as fh:
-        for line in fh:
+        for number, line in enumerate(fh, 1):
             line = line.strip()
-            if line:
+            if not line:
+                continue
+            try:
                 yield json.loads(line)
+            except json.JSONDecodeError:
+                print(f"[jsonl] {path}:{number}: skipping a torn record")
 
 
 def completed_keys(path: str | Path, key: str) -> set[str]:
@@ -28,6 +38,12 @@ def completed_keys(path: str | Path, key: str) -> set[str]:
     return {rec[key] for rec in read_jsonl(path) if key in rec}
 
 
+def _ends_with_newline(path: Path) -> bool:
+    with open(path, "rb") as fh:
+        fh.seek(-1, os.SEEK_END)
+        return fh.read(1) == b"\n"
+
+
 class JsonlWriter:
     """Append-only JSONL writer that flushes after every record."""
 
@@ -35,11 +51,16 @@ class JsonlWriter:
         self.path = Path(path)
         self.path.parent.mkdir(parents=True, exist_ok=True)
         self._fh = open(self.path, "a", encoding="utf-8")
+        if self._fh.tell() and not _ends_with_newline(self.path):
+            self._fh.write("\n")  # terminate a record torn by an interrupted writer
 
     def write(self, record: dict[str, Any]) -> None:
         self._fh.write(json.dumps(record, ensure_ascii=False) + "\n")
         self._fh.flush()
 
+    def fileno(self) -> int:
+        return self._fh.fileno()
+
     def close(self) -> None:
         self._fh.close()
 
@@ -54,7 +75,7 @@ def save_json_atomic(data: Any, path: str | Path, indent: int | None = 4) -> Non
     """Write JSON via a temp file + rename so interrupts never corrupt output."""
     path = Path(path)
     path.parent.mkdir(parents=True, exist_ok=True)
-    tmp = path.with_suffix(path.suffix + ".tmp")
+    tmp = path.with_suffix(path.suffix + f".{os.getpid()}.tmp")  # unique per shard worker
     with open(tmp, "w", encoding="utf-8") as fh:
         json.dump(data, fh, ensure_ascii=False, indent=indent)
     os.replace(tmp, path)
@@ -63,3 +84,95 @@ def save_json_atomic(data: Any, path: str | Path, indent: int | None = 4) -> Non
 def load_json(path: str | Path) -> Any:
     with open(path, "r", encoding="utf-8") as fh:
         return json.load(fh)
+
+
+_NUMBER_CHARS = frozenset("0123456789+-.eE")
+
+
+def iter_json_object(path: str | Path, chunk_size: int = 1 << 20) -> Iterator[tuple[str, Any]]:
+    """Yield the `(key, value)` pairs of a top-level JSON object without loading it whole."""
+    decoder = json.JSONDecoder()
+    with open(path, "r", encoding="utf-8") as fh:
+        buf, pos, eof = "", 0, False
+
+        def fill() -> None:
+            nonlocal buf, pos, eof
+            more = fh.read(chunk_size)
+            eof = not more
+            buf, pos = buf[pos:] + more, 0
+
+        def skip_ws() -> str:
+            nonlocal pos
+            while True:
+                while pos < len(buf) and buf[pos].isspace():
+                    pos += 1
+                if pos < len(buf) or eof:
+                    return buf[pos : pos + 1]
+                fill()
+
+        def decode() -> Any:
+            nonlocal pos
+            while True:
+                try:
+                    value, end = decoder.raw_decode(buf, pos)
+                    # a number at the buffer edge ("-2", "-2.5e") may continue in the next chunk
+                    if eof or (end < len(buf) and buf[end] not in _NUMBER_CHARS):
+                        pos = end
+                        return value
+                except json.JSONDecodeError:
+                    if eof:
+                        raise
+                fill()
+
+        if skip_ws() != "{":
+            raise ValueError(f"{path}: expected a JSON object")
+        pos += 1
+        while True:
+            char = skip_ws()
+            if char == "}":
+                return
+            if char == ",":
+                pos += 1
+                continue
+            key = decode()
+            if skip_ws() != ":":
+                raise ValueError(f"{path}: expected ':' after key {key!r}")
+            pos += 1
+            skip_ws()
+            yield key, decode()
+
+
+class JsonObjectWriter:
+    """Write a top-level JSON object key by key; the file appears atomically on clean exit.
+
+    Produces the same text as `save_json_atomic` would for the whole dict.
+    """
+
+    def __init__(self, path: str | Path, indent: int = 4):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.indent = indent
+        self._tmp = self.path.with_suffix(self.path.suffix + f".{os.getpid()}.tmp")
+        self._fh = open(self._tmp, "w", encoding="utf-8")
+        self._count = 0
+
+    def write(self, key: str, value: Any) -> None:
+        pad = " " * self.indent
+        body = json.dumps(value, ensure_ascii=False, indent=self.indent).replace("\n", "\n" + pad)
+        self._fh.write(("{\n" if not self._count else ",\n") + pad + json.dumps(key, ensure_ascii=False) + ": " + body)
+        self._count += 1
+
+    def close(self) -> None:
+        self._fh.write("\n}" if self._count else "{}")
+        self._fh.close()
+        os.replace(self._tmp, self.path)
+
+    def __enter__(self) -> "JsonObjectWriter":
+        return self
+
+    def __exit__(self, exc_type, *exc: object) -> None:
+        if exc_type is None:
+            self.close()
+        else:  # leave any previous output in place
+            self._fh.close()
+            self._tmp.unlink(missing_ok=True)
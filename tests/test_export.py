@@ -0,0 +1,67 @@
+import pytest
+
+pytest.importorskip("transformers")
+
+import torch
+from PIL import Image
+
+from beyond_images.captioning.captioners import build_captioner
+from beyond_images.captioning.export import check_parity, export_blip
+
+VOCAB = ["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]", "[DEC]", *(f"w{i}" for i in range(58))]
+
+
+@pytest.fixture
+def tiny_blip(tmp_path):
+    from transformers import (
+        BertTokenizerFast,
+        BlipConfig,
+        BlipForConditionalGeneration,
+        BlipImageProcessor,
+        BlipProcessor,
+    )
+
+    vocab_file = tmp_path / "vocab.txt"
+    vocab_file.write_text("\n".join(VOCAB) + "\n", encoding="utf-8")
+    tokenizer = BertTokenizerFast(vocab_file=str(vocab_file))
+    image_processor = BlipImageProcessor(size={"height": 32, "width": 32})
+    config = BlipConfig(
+        vision_config={
+            "hidden_size": 32,
+            "intermediate_size": 64,
+            "num_hidden_layers": 1,
+            "num_attention_heads": 2,
+            "image_size": 32,
+            "patch_size": 8,
+        },
+        text_config={
+            "vocab_size": len(VOCAB),
+            "hidden_size": 32,
+            "intermediate_size": 64,
+            "num_hidden_layers": 1,
+            "num_attention_heads": 2,
+            "max_position_embeddings": 64,
+            "bos_token_id": VOCAB.index("[DEC]"),
+            "sep_token_id": VOCAB.index("[SEP]"),
+            "pad_token_id": VOCAB.index("[PAD]"),
+        },
+    )
+    torch.manual_seed(0)
+    model_dir = tmp_path / "blip"
+    BlipForConditionalGeneration(config).save_pretrained(model_dir)
+    BlipProcessor(image_processor=image_processor, tokenizer=tokenizer).save_pretrained(model_dir)
+    return model_dir
+
+
+def test_float32_export_matches_eager_on_cpu(tiny_blip, tmp_path):
+    export_dir = export_blip(str(tiny_blip), tmp_path / "export")
+    section = {"model": str(tiny_blip), "quantization": "none", "dtype": "float32", "max_new_tokens": 8}
+    eager = build_captioner({**section, "backend": "blip"}, "cpu")
+    exported = build_captioner({**section, "model": str(export_dir), "backend": "blip-torchscript"}, "cpu")
+    images = [Image.new("RGB", (48, 40), (20 * i, 255 - 20 * i, 7 * i)) for i in range(12)]
+
+    report = check_parity(eager, exported, images, batch_size=4)
+
+    assert report["images"] == 12
+    assert report["identical"] == 1.0
+    assert report["eager_sec"] > 0 and report["export_sec"] > 0 and report["speedup"] > 0
@@ -0,0 +1,20 @@
+import json
+
+import pytest
+
+from beyond_images.utils.jsonl import iter_json_object
+
+
+@pytest.mark.parametrize("chunk_size", range(1, 17))
+def test_iter_json_object_numbers_split_across_chunks(tmp_path, chunk_size):
+    path = tmp_path / "data.json"
+    path.write_text('{"a": -2.5e10}', encoding="utf-8")
+    assert list(iter_json_object(path, chunk_size=chunk_size)) == [("a", -2.5e10)]
+
+
+@pytest.mark.parametrize("chunk_size", range(1, 17))
+def test_iter_json_object_matches_json_load(tmp_path, chunk_size):
+    data = {"a": 12, "b": [1.5, -3e-2, True, None], "c": {"d": "x, y}"}, "e": -7}
+    path = tmp_path / "data.json"
+    path.write_text(json.dumps(data, indent=4), encoding="utf-8")
+    assert dict(iter_json_object(path, chunk_size=chunk_size)) == data